@@ -65,6 +65,19 @@ class NpointFlyscan(Mesh):
             print(f"Latency set to {self.latency:g} s, based on active detectors.")
 
 
+    def _grid(self, positions):
+        # each point is a whole line of the fast motor
+        grid = super(NpointFlyscan, self)._grid(positions)
+        if grid is not None:
+            m = self.fastmotor
+            grid['shape'].append(self.fastmotorintervals + 1)
+            grid['axes'].append(m.name)
+            grid['extent'].append(
+                [self.fastmotorstart * m._scaling + m._offset,
+                 self.fastmotorend * m._scaling + m._offset])
+            grid['lines'] = True
+        return grid
+
     def _set_det_trig(self, on):
         # special treatment for the panda box which rules all
         panda = self.panda
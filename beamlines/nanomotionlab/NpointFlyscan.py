@@ -39,6 +39,19 @@ class NpointFlyscan(Mesh):
         except:
             raise
 
+    def _grid(self, positions):
+        # each point is a whole line of the fast motor
+        grid = super(NpointFlyscan, self)._grid(positions)
+        if grid is not None:
+            m = self.fastmotor
+            grid['shape'].append(self.fastmotorintervals + 1)
+            grid['axes'].append(m.name)
+            grid['extent'].append(
+                [self.fastmotorstart * m._scaling + m._offset,
+                 self.fastmotorend * m._scaling + m._offset])
+            grid['lines'] = True
+        return grid
+
     def _set_det_trig(self, on):
         for d in Detector.get_active():
             if isinstance(d, TriggeredDetector):
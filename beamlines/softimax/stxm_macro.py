@@ -135,7 +135,16 @@ class Stxm(SoftwareScan):
                                        status='started',
                                        path=env.paths.directory,
                                        snapshot=snap, 
-                                       description=self._command))
+                                       description=self._command,
+                                       grid=self._grid()))
+
+    def _grid(self, positions=None):
+        # one point per line of the fast motor
+        return {'shape': [self.slow_ints + 1, self.fast_ints + 1],
+                'axes': [self.slow_motor.name, self.fast_motor.name],
+                'extent': [[self.slow_begin, self.slow_end],
+                           [self.fast_begin, self.fast_end]],
+                'lines': True}
 
     def _set_vel(self, vel):
         if self.proxy_attr:
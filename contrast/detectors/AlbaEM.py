@@ -320,6 +320,28 @@ class AlbaEM(Detector, LiveDetector, TriggeredDetector, BurstDetector):
             return st in BUSY_STATES
         assert(False), "Should never get here!"
 
+    def wait_done(self, timeout=None):
+        """
+        When armed for the whole scan, block on the data stream and
+        only check the state when new data arrives.
+        """
+        sock = self.em.pull_sock
+        if not self.global_arm or sock is None:
+            return super(AlbaEM, self).wait_done(timeout)
+        deadline = None if timeout is None else time.time() + timeout
+        while self.busy():
+            wait = self.poll_interval
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if sock.closed:
+                time.sleep(wait)
+            else:
+                sock.poll(int(wait * 1000))
+        return True
+
     def read(self):
         keys = ['t', ] + self.channels
         data = np.array(self.em.data)
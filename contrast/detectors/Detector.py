@@ -4,16 +4,33 @@ from .. import utils
 import numpy as np
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class Detector(Gadget):
     """
     Base class representing any device which can be read out to produce
     recordable data.
+
+    Detectors whose ``read()`` method only returns data which is already
+    available (a cached value or an hdf5 link, for example) can set the
+    attribute ``read_during_motion = True``. Pipelined scans then read
+    them while the motors move to the next position.
+
+    Waiting for an acquisition to finish is done with ``wait_done()``,
+    which polls ``busy()`` every ``poll_interval`` seconds. Subclasses
+    which are notified when data arrives call ``_notify_done()`` to wake
+    up waiting threads immediately, or override ``wait_done()``.
     """
 
+    poll_interval = .05
+
     def __init__(self, *args, **kwargs):
         super(Detector, self).__init__(*args, **kwargs)
+        # let child classes set this if they want
+        if not hasattr(self, 'read_during_motion'):
+            self.read_during_motion = False
+        self._done_event = threading.Event()
         try:
             self.active = True
             self.initialize()
@@ -84,6 +101,25 @@ class Detector(Gadget):
         """
         raise NotImplementedError
 
+    def wait_done(self, timeout=None):
+        """
+        Blocks until the detector is no longer busy.
+
+        :param timeout: Maximum time to wait, None for no limit
+        :type timeout: float
+        :returns: True if the detector is done, False on timeout
+        :rtype: bool
+        """
+        return utils.wait_until_done(self.busy, self._done_event, timeout,
+                                     self.poll_interval)
+
+    def _notify_done(self):
+        """
+        Call this from subclasses when an acquisition might have
+        finished.
+        """
+        self._done_event.set()
+
 
 class TriggerSource(Detector):
     """
@@ -175,8 +211,7 @@ class SoftwareLiveDetector(LiveDetector):
             self.prepare(acqtime, None, 1)
             self.arm()
             self.start()
-            while self.busy():
-                time.sleep(.05)
+            self.wait_done()
 
 
 class TriggeredDetector(object):
@@ -225,8 +260,17 @@ class DetectorGroup(object):
     Collection of ``Detector`` objects to be acquired together, in a
     scan for example. Convenience class to call prepare, arm, busy etc
     in shorthand. Provides some safe measures too.
+
+    Setting ``concurrent = True``, on the class or on an instance, makes
+    the group call its detectors in parallel from a pool of at most
+    ``max_workers`` threads, so that the per-point overhead is the
+    slowest detector's latency rather than the sum of all of them.
     """
 
+    concurrent = False
+    max_workers = 8
+    _executor = None
+
     def __init__(self, *args):
         """
         :param ``*args``: Sequence of ``Detector`` instances
@@ -235,72 +279,103 @@ class DetectorGroup(object):
         for arg in args:
             self.detectors.append(arg)
 
-    def prepare(self, acqtime, dataid, n_starts, trials=1, trial_delay=1.):
+    @classmethod
+    def _get_executor(cls):
         """
-        Runs ``prepare`` on each of the constituent ``Detector``
-        instances.
+        Returns the thread pool shared by all groups, created on first
+        use.
         """
-        for d in self:
-            ok = False
+        if DetectorGroup._executor is None:
+            DetectorGroup._executor = ThreadPoolExecutor(
+                max_workers=cls.max_workers,
+                thread_name_prefix='DetectorGroup')
+        return DetectorGroup._executor
+
+    def _call(self, method, args=(), trials=1, trial_delay=1.,
+              passthrough=(AssertionError,)):
+        """
+        Calls a method on each of the constituent detectors, trying
+        again up to ``trials`` times per detector unless the error is one
+        of ``passthrough``. In concurrent mode, the detectors are called
+        in parallel and the first error to occur is raised once all
+        calls have finished.
+
+        :returns: List of return values in the order of the detectors.
+        """
+        def call_one(d):
             tried = 0
-            while not ok:
+            while True:
                 try:
-                    d.prepare(acqtime, dataid, n_starts)
-                    ok = True
-                except (AssertionError, NotImplementedError):
+                    return getattr(d, method)(*args)
+                except passthrough:
                     raise
                 except:
                     tried += 1
-                    print(('*** problem calling prepare() on %s, trying again '
-                           + 'in %f s...') % (d.name, trial_delay))
+                    print(('*** problem calling %s() on %s, trying again '
+                           + 'in %f s...') % (method, d.name, trial_delay))
                     time.sleep(trial_delay)
                     if tried == trials:
                         raise
 
+        if not (self.concurrent and len(self.detectors) > 1):
+            return [call_one(d) for d in self]
+        futures = [self._get_executor().submit(call_one, d) for d in self]
+        error = None
+        for f in as_completed(futures):
+            if error is None and f.exception() is not None:
+                error = f.exception()
+        if error is not None:
+            raise error
+        return [f.result() for f in futures]
+
+    def prepare(self, acqtime, dataid, n_starts, trials=1, trial_delay=1.):
+        """
+        Runs ``prepare`` on each of the constituent ``Detector``
+        instances.
+        """
+        self._call('prepare', (acqtime, dataid, n_starts), trials,
+                   trial_delay,
+                   passthrough=(AssertionError, NotImplementedError))
+
     def arm(self):
         """
         Arms all constituent devices.
         """
-        for d in self:
-            d.arm()
+        self._call('arm', passthrough=(BaseException,))
 
     def start(self, trials=1, trial_delay=1.):
         """
         Starts all constituent devices.
         """
-        for d in self:
-            ok = False
-            tried = 0
-            while not ok:
-                try:
-                    d.start()
-                    ok = True
-                except AssertionError:
-                    raise
-                except:
-                    tried += 1
-                    print(('*** problem calling start() on %s, trying again '
-                           + 'in %f s...') % (d.name, trial_delay))
-                    time.sleep(trial_delay)
-                    if tried == trials:
-                        raise
+        self._call('start', trials=trials, trial_delay=trial_delay)
 
     def stop(self):
         """
         Stops all constituent devices.
         """
-        for d in self:
-            d.stop()
+        self._call('stop', passthrough=(BaseException,))
 
     def busy(self):
         """
         Checks if one or more of the  constituent devices is busy.
         """
+        if self.concurrent:
+            return True in self._call('busy', passthrough=(BaseException,))
         for d in self:
             if d.busy():
                 return True
         return False
 
+    def wait_done(self, timeout=None):
+        """
+        Waits until none of the constituent devices is busy.
+
+        :param timeout: Maximum time to wait, None for no limit
+        :type timeout: float
+        :returns: True if all are done, False on timeout
+        """
+        return utils.wait_all_done(self.detectors, timeout)
+
     def __iter__(self):
         return self.detectors.__iter__()
 
@@ -308,7 +383,9 @@ class DetectorGroup(object):
         return self.detectors.__len__()
 
     def __add__(self, other):
-        return DetectorGroup(*self.detectors, *other.detectors)
+        group = DetectorGroup(*self.detectors, *other.detectors)
+        group.concurrent = self.concurrent or other.concurrent
+        return group
 
 
 @macro
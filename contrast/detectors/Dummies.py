@@ -8,9 +8,15 @@ from ..recorders.Hdf5Recorder import Link
 
 class DummyDetector(Detector, SoftwareLiveDetector):
     """
-    Dummy detector which returns a single number.
+    Dummy detector which returns a single number. Acquisitions follow
+    ``_clock``, which can be replaced by anything with time() and
+    sleep() methods, and reading takes ``latency`` seconds.
     """
+    _clock = time
+    latency = 0.
+
     def __init__(self, name=None):
+        self.read_during_motion = True
         Detector.__init__(self, name=name)
         SoftwareLiveDetector.__init__(self)
 
@@ -21,23 +27,39 @@ class DummyDetector(Detector, SoftwareLiveDetector):
         super(DummyDetector, self).start()
         try:
             self.val = np.random.rand() * self.acqtime
-            self._started = time.time()
+            self._started = self._clock.time()
         except AttributeError:
             raise Exception('Detector not prepared!')
 
     def stop(self):
         try:
-            self._started = time.time() - self.acqtime
+            self._started = self._clock.time() - self.acqtime
         except AttributeError:
             return
 
     def busy(self):
         try:
-            return time.time() < self._started + self.acqtime
+            return self._clock.time() < self._started + self.acqtime
         except AttributeError:
             return False
 
+    def wait_done(self, timeout=None):
+        """
+        Sleeps until the simulated acquisition is over.
+        """
+        try:
+            remaining = self._started + self.acqtime - self._clock.time()
+        except AttributeError:
+            return True
+        if timeout is not None and timeout < remaining:
+            self._clock.sleep(max(timeout, 0))
+            return not self.busy()
+        self._clock.sleep(max(remaining, 0))
+        return True
+
     def read(self):
+        if self.latency:
+            self._clock.sleep(self.latency)
         try:
             return self.val
         except AttributeError:
@@ -54,7 +76,7 @@ class Dummy1dDetector(DummyDetector):
             # reshape to (1, N) to protect the physical detector dimension
             # from being stacked in the hdf5 file later.
             self.val = (np.random.rand(100) * self.acqtime).reshape((1, -1))
-            self._started = time.time()
+            self._started = self._clock.time()
         except AttributeError:
             raise Exception('Detector not prepared!')
 
@@ -136,7 +158,7 @@ class DummyDictDetector(DummyDetector):
             self.val = {'ch1': np.random.rand() * self.acqtime,
                         'ch2': np.random.rand() * self.acqtime * 2,
                         'ch3': np.random.rand() * self.acqtime * 3, }
-            self._started = time.time()
+            self._started = self._clock.time()
         except AttributeError:
             raise Exception('Detector not prepared!')
 
@@ -31,6 +31,7 @@ class Eiger(Detector, SoftwareLiveDetector, TriggeredDetector, BurstDetector):
         self.acqthread = None
         self.use_image_appendix = use_image_appendix
         self.hw_trig_min_latency = hw_trig_min_latency
+        self.read_during_motion = True
         Detector.__init__(self, name=name)
         SoftwareLiveDetector.__init__(self)
         TriggeredDetector.__init__(self)
@@ -83,6 +84,18 @@ class Eiger(Detector, SoftwareLiveDetector, TriggeredDetector, BurstDetector):
         return not self._get(
             'detector', 'status/state')['value'] in ('idle', 'ready')
 
+    def wait_done(self, timeout=None):
+        """
+        The trigger call returns when the exposure is over, so wait for
+        that thread before polling the detector state.
+        """
+        t0 = time.time()
+        if self.acqthread:
+            self.acqthread.join(timeout)
+        if timeout is not None:
+            timeout = max(timeout - (time.time() - t0), 0)
+        return super(Eiger, self).wait_done(timeout)
+
     @property
     def max_count_rate(self):
         """ Maximum count rate according to the server """
@@ -214,8 +227,7 @@ class Eiger(Detector, SoftwareLiveDetector, TriggeredDetector, BurstDetector):
                     break
                 self.arm()
                 self.start()
-                while self.busy():
-                    time.sleep(.05)
+                self.wait_done()
 
     def get_mask(self):
         """
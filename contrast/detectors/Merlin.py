@@ -78,6 +78,14 @@ class Merlin(Detector, SoftwareLiveDetector, TriggeredDetector, BurstDetector):
         else:
             return False
 
+    def wait_done(self, timeout=None):
+        """
+        Waits for the acquisition thread to finish instead of polling.
+        """
+        if self.acqthread:
+            self.acqthread.join(timeout)
+        return not self.busy()
+
     @property
     def energy(self):
         """ Operating photon energy """
@@ -185,5 +193,4 @@ class Merlin(Detector, SoftwareLiveDetector, TriggeredDetector, BurstDetector):
                     break
                 self.arm()
                 self.start()
-                while self.busy():
-                    time.sleep(.05)
+                self.wait_done()
@@ -35,6 +35,7 @@ class PandaBox(Detector, TriggeredDetector, BurstDetector):
         self.burst_latency = .003
         self.bitblock = bitblock
         self.debug = debug
+        self.read_during_motion = True
         Detector.__init__(self, name=name)
         TriggeredDetector.__init__(self)
         BurstDetector.__init__(self)
@@ -61,6 +62,14 @@ class PandaBox(Detector, TriggeredDetector, BurstDetector):
         else:
             return False
 
+    def wait_done(self, timeout=None):
+        """
+        Waits for the data thread to finish instead of polling.
+        """
+        if self.acqthread:
+            self.acqthread.join(timeout)
+        return not self.busy()
+
     def prepare(self, acqtime, dataid, n_starts):
         BurstDetector.prepare(self, acqtime, dataid, n_starts)
         self.query('PULSE1.PULSES=%d' % self.burst_n)
@@ -12,6 +12,8 @@ class DacMotor(Motor):
     """
     Single DAC controlled piezo axis.
     """
+    # piezo moves settle within milliseconds
+    poll_interval = .01
 
     def __init__(self, device, axis, **kwargs):
         """
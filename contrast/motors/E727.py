@@ -10,6 +10,8 @@ class E727Motor(Motor):
     """
     Single axis on the E727.
     """
+    # piezo moves settle within milliseconds
+    poll_interval = .01
 
     def __init__(self, device, axis, **kwargs):
         """
@@ -18,6 +18,8 @@ class LC400Motor(Motor):
     """
     Single axis on the LC400.
     """
+    # piezo moves settle within milliseconds
+    poll_interval = .01
 
     def __init__(self, device, axis, **kwargs):
         """
@@ -2,6 +2,7 @@ import time
 import numpy as np
 import os
 import ast
+import threading
 
 from ..Gadget import Gadget
 from ..environment import macro, env
@@ -28,8 +29,20 @@ class Motor(Gadget):
     the scaling. In the same way, limits on the user position are
     internally converted to dial limits, such that setting the user
     position leaves the dial limits unchanged.
+
+    Waiting for a move to finish is done with ``wait_done()``, which
+    polls ``busy()`` every ``poll_interval`` seconds. Subclasses which
+    are notified of state changes by the hardware call
+    ``_notify_done()`` to wake up waiting threads immediately, and
+    drivers for fast axes can lower ``poll_interval``.
+
+    Subclasses which know their velocity and acceleration override
+    ``_motion_profile()``, so that ``move_time()`` can estimate how long
+    movements take.
     """
 
+    poll_interval = .05
+
     def __init__(self, scaling=1.0, offset=0.0, dial_limits=(None, None),
                  user_format='%.2f', dial_format='%.2f', **kwargs):
         """
@@ -46,6 +59,7 @@ class Motor(Gadget):
         self._offset = offset
         self._uformat = user_format
         self._dformat = dial_format
+        self._done_event = threading.Event()
 
     @property
     def user_position(self):
@@ -82,6 +96,25 @@ class Motor(Gadget):
     def position(self):
         return self.user_position
 
+    def check_limits(self, positions):
+        """
+        Checks a whole trajectory against the limits of the motor.
+
+        :param positions: Target user positions
+        :type positions: array
+        :returns: Boolean array, False where a position is out of range
+        :rtype: array
+        """
+        positions = np.asarray(positions, dtype=float)
+        dial = (positions - self._offset) / self._scaling
+        ok = np.ones(dial.shape, dtype=bool)
+        _lowlim, _uplim = self.dial_limits
+        if _lowlim is not None:
+            ok &= dial >= _lowlim
+        if _uplim is not None:
+            ok &= dial <= _uplim
+        return ok
+
     def move(self, pos):
         if self.busy():
             raise Exception('Motor is busy')
@@ -125,11 +158,63 @@ class Motor(Gadget):
         """
         raise NotImplementedError
 
+    def wait_done(self, timeout=None):
+        """
+        Blocks until the motor is no longer busy.
+
+        :param timeout: Maximum time to wait, None for no limit
+        :type timeout: float
+        :returns: True if the motor is done, False on timeout
+        :rtype: bool
+        """
+        return utils.wait_until_done(self.busy, self._done_event, timeout,
+                                     self.poll_interval)
+
+    def _notify_done(self):
+        """
+        Call this from subclasses when the hardware reports that a
+        movement might have finished.
+        """
+        self._done_event.set()
+
+    def _motion_profile(self):
+        """
+        Override this method to enable move time estimates. Returns the
+        tuple (velocity, acceleration) in dial units per second and per
+        second squared, where the acceleration can be None if it is
+        negligible. Returns None if the motion is not known.
+        """
+        return None
+
+    def move_time(self, target, start=None):
+        """
+        Estimates the time needed to move the motor.
+
+        :param target: Target user position(s)
+        :type target: float or array
+        :param start: Starting user position(s), defaults to the
+                      current position
+        :type start: float or array
+        :returns: Estimated duration(s) in seconds, or None if unknown
+        """
+        profile = self._motion_profile()
+        if profile is None:
+            return None
+        velocity, acceleration = profile
+        if start is None:
+            start = self.user_position
+        distance = (np.asarray(target) - start) / self._scaling
+        return utils.move_duration(distance, velocity, acceleration)
+
 
 class DummyMotor(Motor):
     """
     Dummy motor which can be harmlessly moved with a velocity of 1 / s.
+    The motion follows ``_clock``, which can be replaced by anything
+    with time() and sleep() methods, like a virtual clock.
     """
+    _clock = time
+
     def __init__(self, velocity=None, dial_position=None, *args, **kwargs):
         super(DummyMotor, self).__init__(*args, **kwargs)
 
@@ -151,7 +236,7 @@ class DummyMotor(Motor):
     @property
     def dial_position(self):
         dpos = self._aim - self._oldpos
-        dt = time.time() - self._started
+        dt = self._clock.time() - self._started
         T = abs(dpos / self.moving_velocity)
         if dt < T:
             return self._oldpos + dpos * dt / T
@@ -161,7 +246,7 @@ class DummyMotor(Motor):
     @dial_position.setter
     def dial_position(self, pos):
         self._oldpos = self.dial_position
-        self._started = time.time()
+        self._started = self._clock.time()
         self._aim = pos
         self.moving_velocity = self.velocity
 
@@ -171,6 +256,21 @@ class DummyMotor(Motor):
     def stop(self):
         self._aim = self.dial_position
 
+    def wait_done(self, timeout=None):
+        """
+        Sleeps until the simulated movement is over.
+        """
+        T = abs((self._aim - self._oldpos) / self.moving_velocity)
+        remaining = self._started + T - self._clock.time()
+        if timeout is not None and timeout < remaining:
+            self._clock.sleep(max(timeout, 0))
+            return not self.busy()
+        self._clock.sleep(max(remaining, 0))
+        return True
+
+    def _motion_profile(self):
+        return self.velocity, None
+
 
 class MotorBookmark(object):
     """
@@ -300,9 +400,8 @@ class Mv(object):
         for m, pos in zip(self.motors, self.targets):
             m.move(pos)
         try:
-            while True in [m.busy() for m in self.motors]:
+            while not utils.wait_all_done(self.motors, timeout=.1):
                 self._run_while_waiting()
-                time.sleep(.01)
         except KeyboardInterrupt:
             for m in self.motors:
                 m.stop()
@@ -14,7 +14,7 @@ class PiezoLegsMotor(Motor):
     Single Pmd301 or Pmd401 PiezoLEGS motor axis.
     """
 
-    def __init__(self, device, axis, velocity=100, **kwargs):
+    def __init__(self, device, axis, velocity=100, step_size=None, **kwargs):
         """
         :param device: Path to the Pmd401 Tango device
         :type device: str
@@ -22,12 +22,17 @@ class PiezoLegsMotor(Motor):
         :type axis: int
         :param velocity: Velocity for the motor. Unit is waveform-steps per second
         :type velocity: int
+        :param step_size: Encoder counts per waveform step, only used
+                          for estimating move times
+        :type step_size: float
         :param ``**kwargs``: Passed on to the ``Motor`` base class
         """
         super(PiezoLegsMotor, self).__init__(**kwargs)
         self.proxy = PyTango.DeviceProxy(device)
         self.proxy.set_source(PyTango.DevSource.DEV)
         self._axis = int(axis)
+        self._velocity = velocity
+        self._step_size = step_size
         command = 'X%dY8,%d;' % (self._axis, velocity)
         self.proxy.arbitrarySend(command)
 
@@ -50,6 +55,11 @@ class PiezoLegsMotor(Motor):
     def stop(self):
         self.proxy.StopAll()  # safety first
 
+    def _motion_profile(self):
+        if self._step_size is None:
+            return None
+        return self._velocity * self._step_size, None
+
     def park(self):
         command = 'X%dM6' % self._axis
         reply = self.proxy.arbitrarySend(command)
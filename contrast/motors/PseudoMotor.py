@@ -4,6 +4,8 @@ combinations of other motors.
 """
 
 from . import Motor
+from .. import utils
+import numpy as np
 
 
 class PseudoMotor(Motor):
@@ -48,6 +50,33 @@ class PseudoMotor(Motor):
     def busy(self):
         return True in [m.busy() for m in self.motors]
 
+    def check_limits(self, positions):
+        """
+        Checks a whole trajectory against the limits of the pseudo motor
+        and, through ``calc_physicals``, of the physical motors. The
+        trajectory is mapped in one call if ``calc_physicals`` handles
+        arrays, and point by point otherwise.
+        """
+        positions = np.asarray(positions, dtype=float)
+        ok = super(PseudoMotor, self).check_limits(positions)
+        # calc_physicals works in dial units, like the dial_position setter
+        dial = (positions - self._offset) / self._scaling
+        try:
+            physicals = np.broadcast_to(
+                np.array(self.calc_physicals(dial), dtype=float),
+                (len(self.motors),) + positions.shape)
+        except (TypeError, ValueError):
+            physicals = np.array([self.calc_physicals(p)
+                                  for p in dial.flat], dtype=float)
+            physicals = physicals.T.reshape(
+                (len(self.motors),) + positions.shape)
+        for m, phys in zip(self.motors, physicals):
+            ok &= m.check_limits(phys)
+        return ok
+
+    def wait_done(self, timeout=None):
+        return utils.wait_all_done(self.motors, timeout)
+
     def stop(self):
         [m.stop for m in self.motors()]
 
@@ -81,7 +110,7 @@ class ExamplePseudoMotor(PseudoMotor):
         return physicals[1] - physicals[0]
 
     def calc_physicals(self, pseudo):
-        current_physicals = self.physicals
+        current_physicals = self.physicals()
         current_diff = self.calc_pseudo(current_physicals)
         half_increase = (pseudo - current_diff) / 2.0
         return [current_physicals[0] - half_increase,
@@ -18,7 +18,11 @@ class SmaractLinearMotor(Motor):
     """
     Single Smaract motor axis.
     """
-    def __init__(self, device, axis, velocity=None, frequency=None, **kwargs):
+    # from device velocity units to dial units per second
+    _velocity_scaling = 1e-3
+
+    def __init__(self, device, axis, velocity=None, frequency=None,
+                 acceleration=None, **kwargs):
         """
         :param device: Path to the MCS Tango device
         :type device: str
@@ -26,12 +30,16 @@ class SmaractLinearMotor(Motor):
         :type axis: int
         :param velocity: Initialize velocity, defaults to None
         :type velocity: float
+        :param acceleration: Acceleration in dial units / s^2, only used
+                             for estimating move times
+        :type acceleration: float
         :param ``**kwargs``: Passed on to the ``Motor`` base class
         """
         super().__init__(**kwargs)
         self.proxy = tango.DeviceProxy(device)
         self.proxy.set_source(tango.DevSource.DEV)
         self.axis = int(axis)
+        self.acceleration = acceleration
         if velocity is not None:
             attr = 'velocity_%d' % self.axis
             self.proxy.write_attribute(attr, velocity * 1e3)
@@ -66,8 +74,21 @@ class SmaractLinearMotor(Motor):
     def stop(self):
         self.proxy.stopAll()  # safety first
 
+    def _motion_profile(self):
+        attr = 'velocity_%d' % self.axis
+        try:
+            velocity = self.proxy.read_attribute(attr).value
+        except tango.DevFailed:
+            return None
+        if not velocity:
+            # no velocity control, the positioner moves as fast as it can
+            return None
+        return velocity * self._velocity_scaling, self.acceleration
+
 
 class SmaractRotationMotor(SmaractLinearMotor):
+    _velocity_scaling = 1e-6
+
     @property
     def dial_position(self):
         attr = 'angle_%d' % self.axis
@@ -11,15 +11,29 @@ class TangoMotor(Motor):
     Single Tango motor.
     """
 
-    def __init__(self, device, **kwargs):
+    def __init__(self, device, events=False, **kwargs):
         """
         :param device: Path to the Tango device
         :type device: str
+        :param events: Subscribe to State change events, so that
+                       ``wait_done()`` returns as soon as the device
+                       reports a new state instead of polling it.
+        :type events: bool
         :param ``**kwargs``: Passed to the ``Motor`` base class
         """
         super(TangoMotor, self).__init__(**kwargs)
         self.proxy = PyTango.DeviceProxy(device)
         self.proxy.set_source(PyTango.DevSource.DEV)
+        if events:
+            # only poll as a fallback, in case an event gets lost
+            self.poll_interval = .5
+            self.proxy.subscribe_event('State',
+                                       PyTango.EventType.CHANGE_EVENT,
+                                       self._state_changed)
+
+    def _state_changed(self, event):
+        if not event.err:
+            self._notify_done()
 
     @property
     def dial_position(self):
@@ -77,3 +91,18 @@ class TangoMotor(Motor):
 
     def stop(self):
         self.proxy.stop()
+
+    def _motion_profile(self):
+        """
+        Uses the Velocity and Acceleration attributes of Pool motors,
+        where the acceleration is given as the time needed to reach the
+        velocity.
+        """
+        try:
+            velocity, ramp = [a.value for a in self.proxy.read_attributes(
+                ['Velocity', 'Acceleration'])]
+        except PyTango.DevFailed:
+            return None
+        if not velocity:
+            return None
+        return abs(velocity), (abs(velocity) / ramp if ramp else None)
@@ -0,0 +1,187 @@
+"""
+Provides a recorder which writes the scalar data of each scan as a
+columnar Arrow table, for fast loading of many scans at once.
+"""
+
+from . import Recorder
+from .Hdf5Recorder import H5_NAME_FORMAT
+from collections import OrderedDict
+import time
+import numpy as np
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = {'feather': '.arrow', 'parquet': '.parquet'}
+
+
+def flatten(dct, prefix=''):
+    """
+    Flattens nested dicts into a single dict with keys like 'det/a/b',
+    keeping only the scalar values.
+    """
+    out = OrderedDict()
+    for key, val in dct.items():
+        key = prefix + str(key)
+        if isinstance(val, dict):
+            out.update(flatten(val, key + '/'))
+        elif val is None or isinstance(val, (bool, int, float, np.number,
+                                             np.bool_)):
+            out[key] = val
+        elif (isinstance(val, np.ndarray) and val.ndim == 0
+              and val.dtype.kind in 'biuf'):
+            out[key] = val.item()
+    return out
+
+
+class ArrowRecorder(Recorder):
+    """
+    Recorder which writes the motor positions, scalar detector values
+    and dt of each scan as Arrow record batches, to a Feather (Arrow
+    IPC) or Parquet file next to the hdf5 file, for example
+    000012.arrow. Dict valued detectors are flattened into columns like
+    'det/a', and arrays are left out. ::
+
+        import pandas
+        df = pandas.read_feather('000012.arrow')
+
+    All columns are stored as float64, with missing values as nulls.
+    The columns are those of the first batch_points points, or of the
+    whole scan if it is shorter. Parquet files get one row group per
+    batch_points points, while Feather files also get the points which
+    have waited for batch_time seconds after the first batch. The scan
+    number and description are stored in the schema metadata.
+    """
+    # only scalars are kept, and those are copied before act_on_data returns
+    zero_copy = True
+
+    def __init__(self, name=None, format='feather', batch_points=500,
+                 batch_time=1.):
+        """
+        :param format: File format, 'feather' or 'parquet'
+        :type format: str
+        :param batch_points: Number of points per record batch
+        :type batch_points: int
+        :param batch_time: Maximum time (in seconds) to keep data in
+                           memory before writing, for Feather files
+                           after the first batch
+        :type batch_time: float
+        """
+        if pa is None:
+            raise ImportError('ArrowRecorder needs pyarrow')
+        if format not in FORMATS:
+            raise ValueError('Unknown format %s' % format)
+        Recorder.__init__(self, name=name, check_interval=batch_time)
+        self.format = format
+        self.batch_points = batch_points
+        self.batch_time = batch_time
+        self.writer = None
+        self.schema = None
+        self.rows = []
+        self._oldest = None
+        self.missing = set()
+        self.ok = False
+
+    def act_on_header(self, dct):
+        """
+        Prepares a new file when a new scan starts.
+        """
+        name = os.path.splitext(H5_NAME_FORMAT % dct['scannr'])[0]
+        self.filename = os.path.join(dct['path'], name + FORMATS[self.format])
+        self.metadata = {'scannr': str(dct['scannr']),
+                         'description': str(dct['description'] or '')}
+        self.writer = None
+        self.schema = None
+        self.rows = []
+        self._oldest = None
+        self.missing = set()
+        self.ok = True
+        if os.path.isfile(self.filename):
+            print('************ WARNING ************')
+            print('Data already exists! ArrowRecorder')
+            print('won''t write data to this target.')
+            print('*********************************')
+            self.ok = False
+
+    def act_on_data(self, dct):
+        """
+        Collects the scalars of a point for the next batch.
+        """
+        if not self.ok:
+            return
+        self.rows.append(flatten(dct))
+        if self._oldest is None:
+            self._oldest = time.time()
+        if len(self.rows) >= self.batch_points:
+            self._flush()
+
+    def _flush(self):
+        """
+        Writes the collected points as one record batch.
+        """
+        rows, self.rows, self._oldest = self.rows, [], None
+        if not rows or not self.ok:
+            return
+        if self.writer is None:
+            names = list(OrderedDict((k, None) for row in rows for k in row))
+            self.schema = pa.schema([(k, pa.float64()) for k in names],
+                                    metadata=self.metadata)
+            try:
+                if self.format == 'parquet':
+                    self.writer = pq.ParquetWriter(self.filename, self.schema)
+                else:
+                    self.writer = pa.ipc.new_file(self.filename, self.schema)
+            except (OSError, pa.ArrowException) as e:
+                print('*********** WARNING ***********')
+                print('Could not open arrow file. Error')
+                print('as follows.')
+                print('*******************************')
+                print(e)
+                self.ok = False
+                return
+        new = set(k for row in rows for k in row) - set(self.schema.names)
+        if new - self.missing:
+            print('ArrowRecorder: %s not in the first batch, left out'
+                  % ', '.join(sorted(new - self.missing)))
+            self.missing |= new
+        columns = [pa.array([None if row.get(k) is None else float(row[k])
+                             for row in rows], type=pa.float64())
+                   for k in self.schema.names]
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
+        self.writer.write_batch(batch)
+
+    def _finish(self):
+        """
+        Writes what is left and closes the file.
+        """
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def act_on_footer(self, dct):
+        """
+        Closes the file after the scan.
+        """
+        self._finish()
+
+    def periodic_check(self):
+        """
+        Writes points which have waited for batch_time, if that doesn't
+        make a short row group or decide the columns.
+        """
+        if self.format == 'parquet' or self.writer is None:
+            return
+        if (self._oldest is not None
+                and time.time() - self._oldest >= self.batch_time):
+            self._flush()
+
+    def _close(self):
+        """
+        Closes the file if the recorder is stopped during a scan.
+        """
+        self._finish()
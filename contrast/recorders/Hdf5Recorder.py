@@ -1,10 +1,81 @@
 from . import Recorder
+from collections import OrderedDict
+import fnmatch
 import h5py
 import time
 import numpy as np
 import os
 
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
 H5_NAME_FORMAT = '%06u.h5'
+# groups which get one value per scan point
+PER_POINT = ('entry/measurement/', 'entry/profiling/')
+
+
+def chunk_shape(shape, dtype, rows=None, target=256 * 1024):
+    """
+    Chunk shape for a dataset of rows stacked along the first axis,
+    aiming at the target number of bytes per chunk but never splitting
+    a row, so that single frames and whole columns read back quickly.
+
+    :param shape: Shape of one row
+    :param dtype: Data type of the dataset
+    :param rows: Expected number of rows, or None if not known
+    """
+    row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+    n = max(target // max(row_bytes, 1), 1)
+    if rows is not None:
+        n = min(n, max(rows, 1))
+    return (int(n),) + tuple(shape)
+
+
+def filter_options(spec):
+    """
+    Translates a compression spec into keyword arguments for
+    ``h5py.Group.create_dataset``. The spec is one of 'lzf', 'gzip',
+    'gzip:<level>', 'bitshuffle' (bitshuffle with LZ4, which needs the
+    hdf5plugin package), None for no compression, or a dict of keyword
+    arguments which is used as is. Byte shuffling is added to lzf and
+    gzip, which helps a lot for slowly varying numbers.
+    """
+    if spec is None or spec == 'none':
+        return {}
+    if isinstance(spec, dict):
+        return dict(spec)
+    name, _, level = str(spec).partition(':')
+    if name == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    elif name == 'gzip':
+        return {'compression': 'gzip',
+                'compression_opts': int(level) if level else 4,
+                'shuffle': True}
+    elif name == 'bitshuffle':
+        if hdf5plugin is None:
+            print('hdf5plugin not found, using lzf instead of bitshuffle')
+            return filter_options('lzf')
+        return dict(hdf5plugin.Bitshuffle(cname='lz4'))
+    raise ValueError('Unknown compression: %s' % spec)
+
+
+class _Buffer(object):
+    """
+    Rows waiting to be written to one dataset.
+    """
+    def __init__(self, dataset, rows):
+        self.data = np.empty((rows,) + dataset.shape[1:],
+                             dtype=dataset.dtype)
+        self.n = 0
+
+    def fits(self, rows):
+        return self.n + len(rows) <= len(self.data)
+
+    def add(self, rows):
+        self.data[self.n:self.n + len(rows)] = rows
+        self.n += len(rows)
 
 
 class Link(h5py.ExternalLink):
@@ -21,10 +92,229 @@ class Link(h5py.ExternalLink):
 class Hdf5Recorder(Recorder):
     """
     Recorder which writes to hdf5 files.
+
+    Datasets which get one value per scan point are preallocated for
+    the number of points announced in the header, and written by index.
+    Datasets of scans with an unknown length grow in steps, and all
+    datasets are trimmed to the data actually written when the scan
+    ends.
+
+    Scalars and small arrays are collected in memory and written in one
+    go every batch_points points or batch_time seconds, and at the end
+    of the scan.
+
+    The measured datasets can be compressed according to a dict of
+    rules, which map key patterns like 'det3' or 'pilatus*', dtype
+    names like 'float64', or dtype kinds like 'f' or 'u' to a
+    compression spec (see ``filter_options``). The first matching rule
+    applies, and rules in the scan header come before those given to
+    the recorder. ::
+
+        Hdf5Recorder(compression={'pilatus*': 'bitshuffle',
+                                  'f': 'gzip:4'})
+
+    Chunks hold whole rows, so single frames can still be read back by
+    decompressing only their own chunks. They aim at 256 kB, up to the
+    size of the scan or growing_chunk_points points if that isn't
+    known.
+
+    With swmr=True, the file is written in single-writer multiple-reader
+    mode, so that online analysis can follow the measured datasets as
+    they grow. The datasets known from the header (see the shapes of
+    ``RecorderHeader``) are created right away, and the rest with the
+    first point and its timing profile, after which the file switches
+    to SWMR mode and is flushed every flush_interval seconds. Since no
+    new objects can be created in SWMR mode, per-point links and
+    datasets which only show up later are written when the scan ends.
+    For that, and for the post scan snapshot, the file is closed and
+    reopened in normal mode at the end of the scan, so live readers
+    have to reopen it after the scan to see the complete file. ::
+
+        # on the reading side
+        with h5py.File(filename, 'r', libver='latest', swmr=True) as fp:
+            d = fp['entry/measurement/det1']
+            d.refresh()
     """
-    def __init__(self, name=None):
-        Recorder.__init__(self, name=name)
+    # largest row in bytes which is buffered rather than written directly
+    max_buffered_row = 64 * 1024
+    # points per chunk at most, when the number of points isn't known
+    growing_chunk_points = 1024
+    # arrays are written or buffered before act_on_data returns
+    zero_copy = True
+    # the scan waits rather than losing data or filling up the memory
+    backpressure = 'block'
+    # the point timing goes in the file too
+    profiles = True
+
+    def __init__(self, name=None, batch_points=100, batch_time=1.,
+                 compression=None, swmr=False, flush_interval=1.):
+        """
+        :param batch_points: Number of points to collect before writing
+        :type batch_points: int
+        :param batch_time: Maximum time (in seconds) to keep data in
+                           memory before writing
+        :type batch_time: float
+        :param compression: Compression rules, or a single spec for all
+                            measured datasets
+        :type compression: dict or str
+        :param swmr: Whether to write in SWMR mode
+        :type swmr: bool
+        :param flush_interval: Time (in seconds) between flushes of the
+                               file in SWMR mode
+        :type flush_interval: float
+        """
+        Recorder.__init__(self, name=name,
+                          check_interval=min(batch_time, flush_interval))
+        if compression is not None and not isinstance(compression, dict):
+            compression = {'*': compression}
+        self.compression = OrderedDict(compression or {})
+        for spec in self.compression.values():
+            filter_options(spec)  # complain early about bad specs
+        self.rules = self.compression
         self.fp = None
+        self.n_positions = None
+        self.filled = {}
+        self.batch_points = batch_points
+        self.batch_time = batch_time
+        self.buffers = {}
+        self._oldest = None
+        self.swmr = swmr
+        self.flush_interval = flush_interval
+        self._live = False
+        self._deferred = []
+        self._measured = 0
+        self._synced = 0.
+
+    def _rows(self, base, rows_per_point):
+        """
+        Number of rows to allocate for a new dataset.
+        """
+        if base in PER_POINT and self.n_positions:
+            return int(self.n_positions) * rows_per_point
+        return rows_per_point
+
+    def _filters(self, name, dtype):
+        """
+        Compression keyword arguments for a new dataset, from the first
+        matching rule.
+        """
+        base = [b for b in PER_POINT if name.startswith(b)]
+        if not base:
+            return {}
+        key = name[len(base[0]):]
+        dtype = np.dtype(dtype)
+        for pattern, spec in self.rules.items():
+            if (pattern in (dtype.name, dtype.kind)
+                    or fnmatch.fnmatchcase(key, pattern)):
+                try:
+                    return filter_options(spec)
+                except Exception as e:
+                    print('Not compressing %s: %s' % (name, e))
+                    return {}
+        return {}
+
+    def _create(self, name, shape, dtype, rows):
+        """
+        Creates a chunked dataset for stacking rows of the given shape.
+        """
+        # swmr readers should only see rows that have been written
+        allocated = 0 if self.swmr else rows
+        # per-point datasets of scans with unknown length will grow,
+        # but chunks are allocated whole, which short scans would feel
+        expected = rows
+        if name.startswith(PER_POINT) and not self.n_positions:
+            expected = rows * self.growing_chunk_points
+        self.fp.create_dataset(name, shape=(allocated,) + tuple(shape),
+                               maxshape=(None,) + tuple(shape),
+                               dtype=dtype,
+                               chunks=chunk_shape(shape, dtype, expected),
+                               **self._filters(name, dtype))
+        self.filled[name] = 0
+
+    def _append(self, name, rows):
+        """
+        Adds rows to a dataset, through its buffer if the rows are small
+        and belong to a point.
+        """
+        rows = np.asarray(rows)
+        if (not name.startswith(PER_POINT) or self.batch_points <= 1
+                or rows.nbytes > self.max_buffered_row * len(rows)):
+            self._write(name, rows)
+            return
+        buf = self.buffers.get(name)
+        if buf is not None and not buf.fits(rows):
+            self._flush()
+            buf = None
+        if buf is None:
+            buf = self.buffers[name] = _Buffer(
+                self.fp[name], self.batch_points * len(rows))
+        buf.add(rows)
+        if self._oldest is None:
+            self._oldest = time.time()
+        if not buf.fits(rows) or self._expired():
+            self._flush()
+
+    def _expired(self):
+        return (self._oldest is not None
+                and time.time() - self._oldest >= self.batch_time)
+
+    def _flush(self):
+        """
+        Writes all buffered rows.
+        """
+        for name, buf in self.buffers.items():
+            if buf.n:
+                self._write(name, buf.data[:buf.n])
+                buf.n = 0
+        self._oldest = None
+
+    def _write(self, name, rows):
+        """
+        Writes rows after the ones already filled in, growing the
+        dataset if it is full.
+        """
+        d = self.fp[name]
+        start = self.filled[name]
+        stop = start + len(rows)
+        if stop > d.shape[0]:
+            d.resize(stop if self.swmr else max(stop, 2 * d.shape[0]),
+                     axis=0)
+        d[start:stop] = rows
+        self.filled[name] = stop
+
+    def _sync(self):
+        """
+        Flushes the file for SWMR readers every flush_interval.
+        """
+        if self._live and time.time() - self._synced >= self.flush_interval:
+            self.fp.flush()
+            self._synced = time.time()
+
+    def _leave_swmr(self):
+        """
+        Reopens the file in normal mode, where new objects can be
+        created, and writes what had to wait for that.
+        """
+        if not self._live:
+            return
+        filename = self.fp.filename
+        self.fp.close()
+        self.fp = h5py.File(filename, 'a', libver='latest')
+        self._live = False
+        deferred, self._deferred = self._deferred, []
+        for dct, base in deferred:
+            self._store(dct, base)
+        self._flush()
+
+    def _trim(self):
+        """
+        Shrinks all datasets to the rows actually written, for scans
+        which were interrupted or shorter than announced.
+        """
+        for name, n in self.filled.items():
+            d = self.fp[name]
+            if d.shape[0] > n:
+                d.resize(n, axis=0)
 
     def act_on_header(self, dct):
         """
@@ -39,7 +329,10 @@ class Hdf5Recorder(Recorder):
             self.fp = None
         else:
             try:
-                self.fp = h5py.File(filename, 'w')
+                if self.swmr:
+                    self.fp = h5py.File(filename, 'w', libver='latest')
+                else:
+                    self.fp = h5py.File(filename, 'w')
             except OSError as e:
                 print('*********** WARNING ***********')
                 print('Could not open hdf5 file. Error')
@@ -47,6 +340,22 @@ class Hdf5Recorder(Recorder):
                 print('*******************************')
                 print(e)
                 self.fp = None
+            self.n_positions = dct.get('n_positions')
+            self.filled = {}
+            self.buffers = {}
+            self._oldest = None
+            self._live = False
+            self._deferred = []
+            self._measured = 0
+            self.rules = OrderedDict(dct.get('compression') or {})
+            for pattern, spec in self.compression.items():
+                self.rules.setdefault(pattern, spec)
+            if self.fp is not None:
+                base = 'entry/measurement/'
+                for key, (shape, dtype) in (dct.get('shapes') or {}).items():
+                    rows_per_point = shape[0] if len(shape) else 1
+                    self._create(base + key, shape[1:], dtype,
+                                 self._rows(base, rows_per_point))
             self.act_on_data({'snapshots/pre_scan/': dct['snapshot']}, base='entry/')
             self.act_on_data({'description': dct['description']},
                              base='entry/')
@@ -58,35 +367,51 @@ class Hdf5Recorder(Recorder):
         if self.fp is None:
             print('** no hdf5 file open, so not writing anything')
             return
+        self._store(dct, base)
+        if base == 'entry/measurement/':
+            self._measured += 1
+        if self.swmr and not self._live and self._measured >= 2:
+            # the datasets of the first point and of its profile exist
+            self.fp.swmr_mode = True
+            self._live = True
+            self._synced = 0.
+        self._sync()
+
+    def _store(self, dct, base):
+        """
+        Writes a dict of values to datasets under base, where dict
+        values go into subgroups.
+        """
         for key, val in dct.items():
             name = base + key
 
             # allow Nones:
             if val is None:
-                val = 'None'
+                if name in self.fp and self.fp[name].dtype.kind == 'f':
+                    val = np.nan
+                else:
+                    val = 'None'
 
             # treat dict values recursively
             if type(val) == dict:
                 new_dct = {key + '/' + str(k): v for k, v in val.items()}
-                self.act_on_data(new_dct, base=base)
+                self._store(new_dct, base)
                 continue
 
             # all other data types
-            create = name not in self.fp
+            create = name not in self.filled and name not in self.fp
+            if self._live and (create or isinstance(val, h5py.ExternalLink)):
+                # no new objects in swmr mode, these wait for the footer
+                if isinstance(val, np.ndarray):
+                    val = val.copy()
+                self._deferred.append(({key: val}, base))
+                continue
             if isinstance(val, np.ndarray):
                 # arrays are stacked along the first index
                 if create:
-                    d = self.fp.create_dataset(name,
-                                               shape=val.shape,
-                                               maxshape=(
-                                                   (None,) + val.shape[1:]),
-                                               dtype=val.dtype)
-                    old = 0
-                else:
-                    d = self.fp[name]
-                    old = d.shape[0]
-                    d.resize((old + val.shape[0],) + d.shape[1:])
-                d[old:] = val
+                    self._create(name, val.shape[1:], val.dtype,
+                                 self._rows(base, val.shape[0]))
+                self._append(name, val)
 
             elif isinstance(val, h5py.ExternalLink):
                 # links
@@ -118,25 +443,21 @@ class Hdf5Recorder(Recorder):
             elif (type(val) == str):
                 # strings
                 if create:
-                    d = self.fp.create_dataset(name, shape=(0,),
-                                               maxshape=(None, ),
-                                               dtype='S100')
-                else:
-                    d = self.fp[name]
+                    self._create(name, (), 'S100', self._rows(base, 1))
                 val = val.encode(encoding='ascii', errors='ignore')
-                d.resize((d.shape[0] + 1,) + d.shape[1:])
-                d[-1] = val
+                self._append(name, [val])
 
             else:
                 # scalars of any type
                 if create:
-                    d = self.fp.create_dataset(name, shape=(0,),
-                                               maxshape=(None, ),
-                                               dtype=type(val))
-                else:
-                    d = self.fp[name]
-                d.resize((d.shape[0] + 1,) + d.shape[1:])
-                d[-1] = val
+                    self._create(name, (), type(val), self._rows(base, 1))
+                self._append(name, [val])
+
+    def act_on_profile(self, dct):
+        """
+        Write point timing profiles to their own group.
+        """
+        self.act_on_data(dct, base='entry/profiling/')
 
     def act_on_footer(self, dct):
         """
@@ -144,6 +465,30 @@ class Hdf5Recorder(Recorder):
         closes the file after the scan.
         """
         if self.fp is not None:
+            self._flush()
+            self._leave_swmr()
             self.act_on_data({'snapshots/post_scan/': dct['snapshot']}, base='entry/')
+            self._trim()
             self.fp.flush()
             self.fp.close()
+
+    def periodic_check(self):
+        """
+        Writes buffered data which has waited for batch_time, and
+        flushes the file for SWMR readers.
+        """
+        if self.fp is not None and self.fp.id.valid:
+            if self._expired():
+                self._flush()
+            self._sync()
+
+    def _close(self):
+        """
+        Writes buffered data and closes the file if the recorder is
+        stopped during a scan.
+        """
+        if self.fp is not None and self.fp.id.valid:
+            self._flush()
+            self._leave_swmr()
+            self._trim()
+            self.fp.close()
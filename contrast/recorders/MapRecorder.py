@@ -0,0 +1,167 @@
+"""
+Provides a recorder which shows 2D grid scans as live images.
+"""
+
+from .PlotRecorder import PlotRecorder, dict_lookup
+from . import Recorder
+from .RecorderHost import active_hosts
+from ..environment import macro
+
+import time
+import numpy as np
+
+
+class MapRecorder(PlotRecorder):
+    """
+    Recorder which shows the data of 2D grid scans as an image, laid
+    out according to the grid geometry in the scan header. Points are
+    placed by their ``grid_index`` if they have one, and in raster
+    order otherwise. Values which are arrays or dicts are reduced to
+    numbers, and scans which deliver a whole line per point, like fly
+    scans, fill one row of the image at a time.
+
+    The image is kept in a preallocated numpy array and redrawn after
+    each batch of queued points, at most max_fps times a second. Scans
+    which aren't 2D grids are ignored.
+    """
+    def __init__(self, data, reduce='sum', name='map'):
+        """
+        :param data: The data to show, like 'diode1' or 'pandabox/x'
+        :type data: str
+        :param reduce: How array and dict values are reduced to
+                       numbers, as the name of a numpy function which
+                       takes an axis argument, like 'sum', 'mean' or
+                       'max'
+        :type reduce: str
+        """
+        if not callable(getattr(np, reduce, None)):
+            raise ValueError('Unknown reduction %s' % reduce)
+        PlotRecorder.__init__(self, data, name=name)
+        self.reduce = reduce
+        self.grid = None
+        self.cbar = None
+
+    def act_on_header(self, dct):
+        self.scannr = dct['scannr']
+        self.point = 0
+        grid = dct.get('grid')
+        if not grid or len(grid['shape']) != 2:
+            self.grid = None
+            return
+        self.grid = grid
+        self.image = np.full(grid['shape'], np.nan)
+
+        # the pixels are centered on the positions
+        edges = []
+        for (start, stop), n in zip(grid['extent'], grid['shape']):
+            half = (stop - start) / max(n - 1, 1) / 2 or .5
+            edges.append((start - half, stop + half))
+        self.ax.clear()
+        self.im = self.ax.imshow(self.image, origin='lower', aspect='auto',
+                                 interpolation='nearest',
+                                 extent=edges[1] + edges[0])
+        if self.cbar is None:
+            self.cbar = self.fig.colorbar(self.im, ax=self.ax)
+        else:
+            self.cbar.update_normal(self.im)
+        self.ax.set_xlabel(grid['axes'][1])
+        self.ax.set_ylabel(grid['axes'][0])
+        self.ax.set_title('%d: %s' % (self.scannr, self.ydata))
+        self.dirty = True
+
+    def act_on_data(self, dct):
+        if self.grid is None:
+            return
+        try:
+            val = dict_lookup(dct, self.ydata)
+        except KeyError:
+            return
+        lines = self.grid.get('lines', False)
+        try:
+            val = self._reduce(val, lines)
+            if 'grid_index' in dct:
+                index = tuple(np.asarray(dct['grid_index']).ravel())
+            else:
+                shape = self.image.shape
+                index = np.unravel_index(self.point,
+                                         shape[:1] if lines else shape)
+            self.point += 1
+            if lines:
+                n = min(len(val), self.image.shape[1])
+                self.image[index[0], :n] = val[:n]
+            else:
+                self.image[index] = val
+        except (TypeError, ValueError, IndexError):
+            # not numbers, or outside the grid
+            return
+        self.dirty = True
+
+    def _reduce(self, val, lines=False):
+        """
+        Reduces a value to a number, or to one number per position
+        along the line if each point is a whole line.
+        """
+        func = getattr(np, self.reduce)
+        if isinstance(val, dict):
+            parts = [self._reduce(v, lines) for v in val.values()]
+            return func(np.array(parts, dtype=float), axis=0)
+        arr = np.asarray(val, dtype=float)
+        if lines:
+            return func(arr.reshape((len(arr), -1)), axis=1)
+        return func(arr.ravel(), axis=0)
+
+    def _render(self):
+        self.dirty = False
+        self.last_draw = time.time()
+        if self.grid is None:
+            return
+        self.im.set_data(self.image)
+        finite = self.image[np.isfinite(self.image)]
+        if len(finite):
+            self.im.set_clim(finite.min(), finite.max())
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def _on_draw(self, event):
+        # the image isn't blitted, the whole figure is drawn
+        pass
+
+
+@macro
+class LiveMap(object):
+    """
+    Start a live map recorder which will show coming 2D scans. Array
+    and dict data are summed, or reduced by another numpy function. ::
+
+        livemap <data> [<reduction>]
+
+    Examples::
+
+        livemap diode1
+        livemap xspress3 max
+
+    If a ``RecorderHost`` is running, the map is added to it instead
+    of getting a process of its own.
+    """
+    def __init__(self, data, reduce='sum'):
+        basename = 'map'
+        name = basename
+        i = 2
+        taken = [r.name for r in Recorder.getinstances()]
+        taken += [n for host in active_hosts() for n in host.hosted]
+        while name in taken:
+            name = basename + '_%d' % i
+            i += 1
+        self.data = data.name if hasattr(data, 'name') else data
+        # builtins like max may come in instead of their names
+        self.reduce = getattr(reduce, '__name__', reduce)
+        self.name = name
+
+    def run(self):
+        hosts = active_hosts()
+        if hosts:
+            # no new process needed
+            hosts[0].add(self.name, MapRecorder, data=self.data, reduce=self.reduce)
+        else:
+            rec = MapRecorder(data=self.data, reduce=self.reduce, name=self.name)
+            rec.start()
@@ -1,7 +1,10 @@
 from . import Recorder
+from .RecorderHost import active_hosts
 from ..environment import macro
 
 import signal
+import time
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
 
@@ -24,13 +27,77 @@ def dict_lookup(dct, path):
             except ValueError:
                 raise KeyError(path)
 
+
+def minmax_decimate(x, y, bins):
+    """
+    Reduces a curve to the smallest and largest y value in each of a
+    number of equally long stretches of points, which looks the same
+    as the full curve when each stretch covers about one pixel.
+
+    :param x: The x values
+    :param y: The y values
+    :param bins: Number of stretches
+    :returns: The decimated x and y arrays
+    """
+    n = len(y)
+    if bins < 1 or n <= 2 * bins:
+        return x, y
+    width = n // bins
+    m = width * bins
+    blocks = y[:m].reshape(bins, width)
+    offsets = np.arange(bins)[:, None] * width
+    lo = np.nanargmin(np.where(np.isnan(blocks), np.inf, blocks), axis=1)
+    hi = np.nanargmax(np.where(np.isnan(blocks), -np.inf, blocks), axis=1)
+    # keep each pair in the order the points came in
+    idx = np.sort(np.hstack([lo[:, None], hi[:, None]]), axis=1) + offsets
+    idx = np.concatenate([idx.ravel(), np.arange(m, n)])
+    return x[idx], y[idx]
+
+
+def _scalar(val):
+    return np.nan if val is None else float(val)
+
+
+class _Growable(object):
+    """
+    Numpy buffer which doubles its size when it is full.
+    """
+    def __init__(self, size=1024):
+        self.buf = np.empty(size, dtype=float)
+        self.n = 0
+
+    def append(self, val):
+        if self.n == len(self.buf):
+            self.buf = np.concatenate([self.buf, np.empty_like(self.buf)])
+        self.buf[self.n] = val
+        self.n += 1
+
+    @property
+    def data(self):
+        return self.buf[:self.n]
+
+
 class PlotRecorder(Recorder):
     """
     Recorder which catches data and plots it with matplotlib.
 
     Unlike the base class Recorder, the GUI event loop takes care of
-    the timing (plt.timer) and when to close (plt.show).
+    the timing (plt.timer) and when to close (plt.show). Data which
+    the plot can't keep up with is dropped rather than delaying the
+    scan.
+
+    The data are kept in numpy buffers, and the plot is redrawn after
+    each batch of queued points, at most max_fps times a second. The
+    lines of the current scan are blitted onto the rest of the figure,
+    which is only redrawn when the axes limits have to grow. Curves
+    longer than the axes are wide in pixels are decimated to their
+    min/max envelope.
     """
+    backpressure = 'drop'
+    # runs the GUI event loop, see RecorderHost
+    gui = True
+    max_fps = 10
+    margin = .05
 
     def __init__(self, data1, data2=None, name='plot'):
         Recorder.__init__(self, name=name)
@@ -43,12 +110,7 @@ class PlotRecorder(Recorder):
         self.nplots = 0
 
     def init(self):
-        # set up figure and axes
-        self.fig = plt.figure()
-        self.fig.canvas.set_window_title(self.name)
-        self.ax = self.fig.gca()
-        self.ax.set_xlabel(self.xdata)
-        self.ax.set_ylabel(self.ydata)
+        self._setup()
 
         # add a timer to trigger periodic checking of the queue
         self.timer = self.fig.canvas.new_timer(interval=int(self.delay * 1000))
@@ -58,21 +120,42 @@ class PlotRecorder(Recorder):
         # blocking show() manages when the application should close
         plt.show()
 
+    def _setup(self):
+        # set up figure and axes
+        self.fig = plt.figure()
+        self.fig.canvas.manager.set_window_title(self.name)
+        self.ax = self.fig.gca()
+        self.ax.set_xlabel(self.xdata)
+        self.ax.set_ylabel(self.ydata)
+        self.lines = {}
+        self.dirty = False
+        self.last_draw = 0.
+        self.background = None
+        self.static = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
     def _timer_callback(self):
         # this SIGINT handling has to be set up here, for some reason
         signal.signal(signal.SIGINT, signal.SIG_IGN)
         self._process_queue()
+        self._refresh()
         self.periodic_check()
         if self.quit:
             self._close()
 
+    def _refresh(self):
+        # redraw what has come in, if it is time for a new frame
+        if self.dirty and time.time() - self.last_draw >= 1. / self.max_fps:
+            self._render()
+
     def run(self):
         self.init()
 
     def act_on_header(self, dct):
         # start a new scan
+        self._finish_lines()
         self.nplots += 1
-        self.x = []
+        self.x = _Growable()
         self.new_scan = True
         self.scannr = dct['scannr']
 
@@ -80,6 +163,9 @@ class PlotRecorder(Recorder):
         # if our data isn't in dct, just move on
         try:
             new_data = dict_lookup(dct, self.ydata)
+            if self.xdata is not None:
+                # checking if we have explicit x data
+                x = dct[self.xdata]
         except KeyError:
             return
 
@@ -97,30 +183,117 @@ class PlotRecorder(Recorder):
                       for i, k in enumerate(new_data.keys())}
             self.lines = {key: Line2D(xdata=[], ydata=[], color=col,
                                       linestyle=styles[key], label='%d: %s'
-                                      % (self.scannr, key))
+                                      % (self.scannr, key), animated=True)
                           for key in new_data.keys()}
-            self.y = {key: [] for key in new_data.keys()}
+            self.y = {key: _Growable() for key in new_data.keys()}
             for k, l in self.lines.items():
                 self.ax.add_line(l)
             self.ax.legend()
+            self.background = None
 
-        # ok treat the actual data
-        for k, v in new_data.items():
+        # ok treat the actual data, drawing is left to the timer
+        try:
+            values = {k: _scalar(new_data.get(k)) for k in self.y}
+            x = self.x.n if self.xdata is None else _scalar(x)
+        except (TypeError, ValueError):
+            # not a number, forget this point
+            return
+        for k, v in values.items():
             self.y[k].append(v)
-        if self.xdata is not None:
-            # checking if we have explicit x data
-            try:
-                self.x.append(dct[self.xdata])
-            except KeyError:
-                return
-        else:
-            self.x = range(len(self.y[k]))
+        self.x.append(x)
+        self.dirty = True
+
+    def _curves(self):
+        """
+        The (decimated) data of each line of the current scan.
+        """
+        bins = int(self.ax.get_window_extent().width)
+        x = self.x.data
+        return {k: minmax_decimate(x, self.y[k].data, bins)
+                for k in self.lines}
+
+    def _limits(self, curves):
+        """
+        Returns new axes limits if the data don't fit in the current
+        ones, otherwise None.
+        """
+        x = np.concatenate([c[0] for c in curves.values()])
+        y = np.concatenate([c[1] for c in curves.values()])
+        x, y = x[np.isfinite(x)], y[np.isfinite(y)]
+        if not len(x) or not len(y):
+            return None
+        lims = []
+        for i, (data, view) in enumerate(((x, self.ax.get_xlim()),
+                                          (y, self.ax.get_ylim()))):
+            lo, hi = data.min(), data.max()
+            if self.static is not None:
+                lo, hi = min(lo, self.static[i][0]), max(hi, self.static[i][1])
+            if lo >= view[0] and hi <= view[1]:
+                lims.append(view)
+            else:
+                pad = self.margin * ((hi - lo) or abs(hi) or 1.)
+                lims.append((lo - pad, hi + pad))
+        if lims == [self.ax.get_xlim(), self.ax.get_ylim()]:
+            return None
+        return lims
+
+    def _render(self):
+        """
+        Brings the lines of the current scan up to date.
+        """
+        self.dirty = False
+        self.last_draw = time.time()
+        curves = self._curves()
         for k, l in self.lines.items():
-            l.set_data(self.x, self.y[k])
+            l.set_data(*curves[k])
+        lims = self._limits(curves)
+        canvas = self.fig.canvas
+        if lims is not None:
+            self.ax.set_xlim(*lims[0])
+            self.ax.set_ylim(*lims[1])
+            self.background = None
+        if self.background is None or not getattr(canvas, 'supports_blit',
+                                                  False):
+            # a full draw, _on_draw then blits the lines on top
+            canvas.draw()
+        else:
+            self._blit()
+        canvas.flush_events()
+
+    def _on_draw(self, event):
+        # keep the figure without the animated lines for blitting
+        canvas = self.fig.canvas
+        if getattr(canvas, 'supports_blit', False):
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+        self._blit(restore=False)
 
+    def _blit(self, restore=True):
+        canvas = self.fig.canvas
+        if restore and self.background is not None:
+            canvas.restore_region(self.background)
+        for l in self.lines.values():
+            self.ax.draw_artist(l)
+        if getattr(canvas, 'supports_blit', False):
+            canvas.blit(self.ax.bbox)
+
+    def _finish_lines(self):
+        """
+        Hands the lines of the last scan over to the ordinary drawing,
+        with all their points.
+        """
+        self.static = None
+        if not self.lines:
+            return
+        for k, l in self.lines.items():
+            l.set_data(self.x.data, self.y[k].data)
+            l.set_animated(False)
+        self.lines = {}
         self.ax.relim()
-        self.ax.autoscale_view()
-        plt.draw()
+        self.static = (tuple(self.ax.dataLim.intervalx),
+                       tuple(self.ax.dataLim.intervaly))
+        self.background = None
+        self.dirty = False
+        self.fig.canvas.draw_idle()
 
     def _close(self):
         plt.close(self.fig)
@@ -137,12 +310,17 @@ class LivePlot(object):
 
         liveplot xmotor diode1
         liveplot diode1
+
+    If a ``RecorderHost`` is running, the plot is added to it instead
+    of getting a process of its own.
     """
     def __init__(self, data1, data2=None):
         basename = 'plot'
         name = basename
         i = 2
-        while name in [r.name for r in Recorder.getinstances()]:
+        taken = [r.name for r in Recorder.getinstances()]
+        taken += [n for host in active_hosts() for n in host.hosted]
+        while name in taken:
             name = basename + '_%d' % i
             i += 1
         self.data1 = data1.name if hasattr(data1, 'name') else data1
@@ -150,5 +328,10 @@ class LivePlot(object):
         self.name = name
 
     def run(self):
-        rec = PlotRecorder(data1=self.data1, data2=self.data2, name=self.name)
-        rec.start()
+        hosts = active_hosts()
+        if hosts:
+            # no new process needed
+            hosts[0].add(self.name, PlotRecorder, data1=self.data1, data2=self.data2)
+        else:
+            rec = PlotRecorder(data1=self.data1, data2=self.data2, name=self.name)
+            rec.start()
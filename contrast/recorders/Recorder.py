@@ -1,8 +1,14 @@
 from ..Gadget import Gadget
 from .. import utils
 from ..environment import macro
+from . import SharedMemory
+from collections import OrderedDict
 import time
 import signal
+import queue
+import pickle
+import threading
+import bisect
 
 from multiprocessing import get_context
 # Fancy multiprocessing contexts needed or we will crash matplotlib
@@ -21,15 +27,27 @@ class Process(ctx.Process):
 class RecorderHeader(dict):
     """
     Helper class to define a specific dict format to send recorders
-    when a new scan starts.
+    when a new scan starts. The number of points, if known, is given as
+    n_positions, and shapes maps the data keys which are known before
+    the scan to the (shape, dtype) of one point's value. Compression
+    rules for recorders which write files can be given as compression,
+    see ``Hdf5Recorder``. Scans which cover a grid describe it as grid,
+    a dict with the number of points along each axis as 'shape', the
+    motor names as 'axes', their [start, stop] as 'extent', and 'lines'
+    set if each point carries a whole line along the last axis.
     """
     def __init__(self, scannr, path, snapshot=None, description=None,
-                 status=None):
+                 status=None, n_positions=None, shapes=None,
+                 compression=None, grid=None):
         super(RecorderHeader, self).__init__(scannr=scannr,
                                              status=status,
                                              path=path,
                                              snapshot=snapshot,
-                                             description=description)
+                                             description=description,
+                                             n_positions=n_positions,
+                                             shapes=shapes,
+                                             compression=compression,
+                                             grid=grid)
 
 
 class RecorderFooter(dict):
@@ -46,15 +64,117 @@ class RecorderFooter(dict):
                                              description=description)
 
 
+class RecorderProfile(dict):
+    """
+    Helper class to define a specific dict format to send recorders
+    with the durations of the phases of a scan point. See
+    ``contrast.scans.Profiling.PointProfile``.
+    """
+    pass
+
+
+class Packed(object):
+    """
+    A message which has been pickled once for all recorders, see
+    ``RecorderBus``.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.sent = time.time()
+
+
+class RecorderMetrics(object):
+    """
+    Live statistics of a recorder, kept in shared memory so that the
+    recorder process can update them while the main process reads them.
+    The lag is the time between sending and handling a message, and the
+    processing times of messages are counted in bins with the upper
+    edges ``edges`` plus one bin for longer times. ::
+
+        r.metrics['handled'], r.metrics['lag'], r.metrics.histogram()
+    """
+    fields = ('handled', 'rate', 'lag', 'max_lag', 'dropped', 'coalesced')
+    edges = (1e-4, 1e-3, 1e-2, 1e-1, 1.)
+
+    def __init__(self):
+        self.values = ctx.RawArray('d', len(self.fields)
+                                   + len(self.edges) + 1)
+
+    def __getitem__(self, field):
+        return self.values[self.fields.index(field)]
+
+    def __setitem__(self, field, val):
+        self.values[self.fields.index(field)] = val
+
+    def add_time(self, dt):
+        """
+        Counts the processing time of one message.
+        """
+        i = bisect.bisect_left(self.edges, dt)
+        self.values[len(self.fields) + i] += 1
+
+    def histogram(self):
+        """
+        Returns the counts of the processing time bins.
+        """
+        return list(self.values[len(self.fields):])
+
+    def percentile(self, q):
+        """
+        Upper edge of the bin which holds the q-th percentile of the
+        processing times, or None if nothing has been processed.
+        """
+        counts = self.histogram()
+        total = sum(counts)
+        if not total:
+            return None
+        cumulative = 0
+        for edge, n in zip(self.edges + (float('inf'),), counts):
+            cumulative += n
+            if cumulative >= total * q / 100.:
+                return edge
+
+
 class Recorder(Gadget, Process):
     """
     Base class for Recorders. Provides the multiprocessing and queuing
     functionality.
+
+    The main loop blocks on the queue, so that messages are handled as
+    soon as they arrive, and calls ``periodic_check`` every
+    check_interval seconds. Messages which have piled up are taken off
+    the queue together, up to max_batch at a time.
+
+    Large arrays which arrive through shared memory (see
+    ``SharedMemory``) are copied out before ``act_on_data`` is called,
+    unless zero_copy is set. Then act_on_data gets views which are only
+    valid until it returns.
+
+    When more than max_queue messages are waiting, the backpressure
+    policy decides what happens to new ones sent through the
+    ``RecorderBus``: 'block' makes the scan wait, 'drop' throws away
+    data and profiles, 'coalesce' only keeps the newest data and
+    profile, and None lets the queue grow. Headers and footers always
+    get through. The state of the recorder is kept in ``metrics``.
+
+    The timing profile of each scan point (``RecorderProfile``) is only
+    sent to recorders which set profiles, and handed to
+    ``act_on_profile``.
     """
-    def __init__(self, delay=.1, **kwargs):
+    max_batch = 1000
+    zero_copy = False
+    backpressure = None
+    max_queue = 1000
+    gui = False
+    profiles = False
+
+    def __init__(self, delay=.1, check_interval=1., **kwargs):
         """
-        :param delay: Sleep time for the queue checking loop.
+        :param delay: Polling interval for recorders which can't block
+                      on the queue, like ``PlotRecorder``.
         :type delay: float
+        :param check_interval: Time between calls to periodic_check.
+        :type check_interval: float
         :param ``**kwargs``: Passed on to base class constructor
         """
         Process.__init__(self)
@@ -62,22 +182,59 @@ class Recorder(Gadget, Process):
         ctx = get_context('spawn')
         self.queue = ctx.Queue()
         self.delay = delay
+        self.check_interval = check_interval
         self.quit = False
+        self.metrics = RecorderMetrics()
+        self._rate_t = time.time()
+        self._rate_n = 0
 
-    def _process_queue(self):
+    def _process_queue(self, timeout=0):
+        """
+        Handles the messages waiting in the queue, after waiting at most
+        timeout seconds for the first one.
+        """
         dcts = []
-        while not self.queue.empty():
+        try:
             # ok since only we are reading from self.queue:
-            dcts.append(self.queue.get())
+            dcts.append(self.queue.get(timeout=timeout))
+            while len(dcts) < self.max_batch:
+                dcts.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
         for dct in dcts:
-            if dct is None:
-                self.quit = True
-            elif isinstance(dct, RecorderHeader):
-                self.act_on_header(dct)
-            elif isinstance(dct, RecorderFooter):
-                self.act_on_footer(dct)
-            else:
+            t0 = time.time()
+            if isinstance(dct, Packed):
+                lag = t0 - dct.sent
+                self.metrics['lag'] = lag
+                self.metrics['max_lag'] = max(self.metrics['max_lag'], lag)
+                dct = pickle.loads(dct.data)
+            self._handle(dct)
+            self.metrics.add_time(time.time() - t0)
+            self.metrics['handled'] += 1
+        now = time.time()
+        if now - self._rate_t >= 1.:
+            handled = self.metrics['handled']
+            self.metrics['rate'] = (handled - self._rate_n) / (now - self._rate_t)
+            self._rate_t, self._rate_n = now, handled
+
+    def _handle(self, dct):
+        """
+        Passes one message on to the right act_on_* method.
+        """
+        if dct is None:
+            self.quit = True
+        elif isinstance(dct, RecorderHeader):
+            self.act_on_header(dct)
+        elif isinstance(dct, RecorderFooter):
+            self.act_on_footer(dct)
+        elif isinstance(dct, RecorderProfile):
+            self.act_on_profile(dct)
+        else:
+            shared = SharedMemory.attach(dct, copy=not self.zero_copy)
+            try:
                 self.act_on_data(dct)
+            finally:
+                SharedMemory.release(shared, self.name)
 
     def run(self):
         """
@@ -86,10 +243,12 @@ class Recorder(Gadget, Process):
         # ignore SIGINT signals from ctrl-C in the main process
         signal.signal(signal.SIGINT, signal.SIG_IGN)
         self.init()
+        next_check = time.time() + self.check_interval
         while not self.quit:
-            time.sleep(self.delay)
-            self._process_queue()
-            self.periodic_check()
+            self._process_queue(timeout=max(next_check - time.time(), 0))
+            if time.time() >= next_check:
+                self.periodic_check()
+                next_check = time.time() + self.check_interval
         self._close()
 
     def init(self):
@@ -120,9 +279,17 @@ class Recorder(Gadget, Process):
         """
         pass
 
+    def act_on_profile(self, dct):
+        """
+        *Override this,* and set profiles. Performs an action when the
+        timing profile of a scan point is received. The keys of dct are
+        the phases of the point, see ``RecorderProfile``.
+        """
+        pass
+
     def periodic_check(self):
         """
-        A function which gets called on every iteration of the recorder.
+        A function which gets called every check_interval seconds.
         Useful for example for checking if files should be closed or
         whether a plot window still exists.
         """
@@ -133,11 +300,22 @@ class Recorder(Gadget, Process):
         """
         pass
 
+    def queue_depth(self):
+        """
+        Number of messages waiting in the queue.
+        """
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # not available on macOS
+            return 0
+
     def stop(self):
         """
         Stop a started subprocess safely by putting a poison pill in
-        its queue.
+        its queue, after the messages on their way.
         """
+        bus.join()
         self.queue.put(None)
 
 
@@ -171,11 +349,134 @@ def active_recorders():
     return [r for r in Recorder.getinstances() if r.is_alive()]
 
 
+class RecorderBus(object):
+    """
+    Passes messages on to recorders from a background thread, so that
+    the sender doesn't wait. Each message is pickled once, and the same
+    bytes are put in the queue of every recorder, where they are
+    unpickled by ``Recorder``. Messages put directly in the recorder
+    queues are handled as before. ::
+
+        bus.publish(dct)
+        bus.join()  # wait until everything has been handed over
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # coalesced messages
+
+    def publish(self, msg, recorders=None, shared_memory=None):
+        """
+        Queues a message for sending.
+
+        :param msg: The message
+        :param recorders: The recorders to send to, defaults to the
+                          active ones at the time of sending
+        :type recorders: list
+        :param shared_memory: Ring for large arrays in data messages
+        :type shared_memory: SharedRing
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+        # recorders which would rather have the scan wait, counting
+        # what is still on its way through the bus
+        for r in (recorders or []):
+            if r.backpressure == 'block':
+                while (r.queue_depth() + self._queue.qsize() >= r.max_queue
+                       and r.is_alive()):
+                    time.sleep(.01)
+        self._queue.put((msg, recorders, shared_memory))
+
+    def join(self):
+        """
+        Waits until all published messages have been put in the
+        recorder queues.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            msg, recorders, shared_memory = self._queue.get()
+            try:
+                if recorders is None:
+                    recorders = active_recorders()
+                if shared_memory is not None and isinstance(msg, OrderedDict):
+                    readers = tuple(r.name for r in recorders)
+                    msg = shared_memory.share(msg, readers,
+                                              alive=set(readers))
+                packed = Packed(pickle.dumps(msg, protocol=-1))
+                for r in recorders:
+                    self._send(r, packed, msg)
+            except Exception as e:
+                print('RecorderBus could not send a message: %s' % e)
+            finally:
+                self._queue.task_done()
+
+
+    def _send(self, r, packed, msg):
+        """
+        Puts a message in the queue of one recorder, according to its
+        backpressure policy.
+        """
+        if isinstance(msg, (RecorderHeader, RecorderFooter)) or msg is None:
+            kind = None
+        else:
+            kind = 'profile' if isinstance(msg, RecorderProfile) else 'data'
+        policy = r.backpressure
+        if (kind is not None and policy in ('drop', 'coalesce')
+                and r.queue_depth() >= r.max_queue):
+            if policy == 'drop':
+                r.metrics['dropped'] += 1
+                self._discard(r, msg)
+            else:
+                if (r.name, kind) in self._pending:
+                    r.metrics['coalesced'] += 1
+                    self._discard(r, self._pending[(r.name, kind)][1])
+                self._pending[(r.name, kind)] = (packed, msg)
+            return
+        # there is room, so older coalesced messages go first
+        for key in [k for k in self._pending if k[0] == r.name]:
+            r.queue.put(self._pending.pop(key)[0])
+        r.queue.put(packed)
+
+    def _discard(self, r, msg):
+        # the recorder won't release its shared arrays itself
+        if isinstance(msg, dict):
+            SharedMemory.release(SharedMemory.descriptors(msg), r.name)
+
+
+bus = RecorderBus()
+
+
 @macro
 class LsRec(object):
     """
-    List active recorders.
+    List active recorders, with the number of waiting messages, the
+    number of handled messages, the rate, the lag behind the scan, the
+    median and 99th percentile processing times, the backpressure
+    policy, and the numbers of dropped and coalesced messages.
     """
     def run(self):
-        dct = {r.name: r.__class__ for r in active_recorders()}
-        print(utils.dict_to_table(dct, titles=('name', 'class')))
+        def fmt(t):
+            return '-' if t is None else '<%g' % (t * 1e3)
+        table = []
+        for r in active_recorders():
+            m = r.metrics
+            table.append([r.name, r.__class__.__name__,
+                          str(r.queue_depth()),
+                          '%d' % m['handled'],
+                          '%.1f' % m['rate'],
+                          '%.3f' % m['lag'],
+                          '%s / %s' % (fmt(m.percentile(50)),
+                                       fmt(m.percentile(99))),
+                          str(r.backpressure),
+                          '%d' % m['dropped'],
+                          '%d' % m['coalesced']])
+        titles = ['name', 'class', 'queued', 'handled', 'msg/s', 'lag (s)',
+                  'time p50/p99 (ms)', 'policy', 'dropped', 'coalesced']
+        print(utils.list_to_table(lst=table, titles=titles))
@@ -0,0 +1,345 @@
+"""
+Provides a recorder process which hosts other recorders, so that they
+share one interpreter and one input queue.
+"""
+
+from .Recorder import (Recorder, RecorderProfile, active_recorders, bus,
+                       ctx)
+from . import SharedMemory
+from .. import utils
+from ..environment import macro
+from collections import OrderedDict
+import copy
+import queue
+import signal
+import time
+
+
+def _copy(dct):
+    """
+    Copies a message and the dicts in it, but not the arrays.
+    """
+    out = copy.copy(dct)
+    for key, val in out.items():
+        if isinstance(val, dict):
+            out[key] = _copy(val)
+    return out
+
+
+class HostCommand(dict):
+    """
+    Helper class to define a specific dict format to send a
+    ``RecorderHost`` when recorders are added or removed, or when the
+    state of its recorders is requested.
+    """
+    def __init__(self, command, name=None, cls=None, args=(), kwargs=None,
+                 token=None):
+        super(HostCommand, self).__init__(command=command,
+                                          name=name,
+                                          cls=cls,
+                                          args=args,
+                                          kwargs=kwargs or {},
+                                          token=token)
+
+
+class RecorderHost(Recorder):
+    """
+    Recorder process which runs other recorders, so that a whole set of
+    them costs one interpreter and gets each message through one queue.
+    Recorders are added and removed while the host is running, and are
+    created inside the host from their class and arguments, so their
+    classes have to be importable. ::
+
+        host = RecorderHost(name='host')
+        host.start()
+        host.add('h5', Hdf5Recorder)
+        host.add('plot', PlotRecorder, 'samx', 'det1')
+        host.health()
+        host.remove('plot')
+
+    Each recorder gets its own copy of every message and of the dicts
+    in it, while arrays are shared between the recorders and must not
+    be changed in place. ``periodic_check`` is called on the schedule
+    of each recorder. A recorder which raises an exception is left in
+    place, and the error is reported by ``health`` and the ``lshost``
+    macro. The host makes the scan wait if one of its recorders would,
+    see ``Recorder``, and gets the timing profiles of the scan points
+    if one of them wants those.
+
+    Recorders with ``gui`` set, like ``PlotRecorder``, have their
+    windows set up with ``_setup`` and redrawn with ``_refresh``, and
+    the host handles GUI events every gui_interval seconds between
+    messages instead of blocking in ``plt.show``. Such a recorder is
+    removed when its window is closed.
+    """
+    gui_interval = .02
+
+    def __init__(self, name='host', **kwargs):
+        """
+        :param ``**kwargs``: Passed on to base class constructor
+        """
+        Recorder.__init__(self, name=name, **kwargs)
+        self.replies = ctx.Queue()
+        self._hosted = OrderedDict()  # name: class, in the main process
+        self.plugins = OrderedDict()  # name: recorder, in the host
+        self._asked = 0
+
+    # main process side
+
+    def add(self, name, cls, *args, **kwargs):
+        """
+        Starts a recorder in the host.
+
+        :param name: Name of the new recorder
+        :type name: str
+        :param cls: Recorder class
+        :param ``*args``, ``**kwargs``: Passed on to the constructor
+        :returns: True if the recorder was started, the host prints the
+                  error otherwise
+        """
+        bus.join()
+        self._asked += 1
+        token = self._asked
+        self.queue.put(HostCommand('add', name, cls, args, kwargs,
+                                   token=token))
+        ok = None
+        while ok is None and self.is_alive():
+            ok = self._collect(token, timeout=1.)
+        # a recorder which replaced one by the same name is gone too
+        self._hosted.pop(name, None)
+        if ok:
+            self._hosted[name] = cls
+        self._set_policy()
+        return bool(ok)
+
+    def remove(self, name):
+        """
+        Stops and removes a recorder from the host.
+        """
+        bus.join()
+        self.queue.put(HostCommand('remove', name))
+        self._collect()
+        self._hosted.pop(name, None)
+        self._set_policy()
+
+    @property
+    def hosted(self):
+        """
+        The names and classes of the hosted recorders.
+        """
+        self._collect()
+        return self._hosted
+
+    def health(self, timeout=5.):
+        """
+        Asks the host about its recorders. The answer comes after the
+        messages already queued have been handled.
+
+        :param timeout: Time to wait for the answer, in seconds
+        :returns: A dict of dicts with the class, the number of handled
+                  messages, the seconds since the last one, the median
+                  and 99th percentile processing times, the number of
+                  errors and the last error of each recorder, or None
+                  if the host didn't answer in time.
+        """
+        self._asked += 1
+        self.queue.put(HostCommand('health', token=self._asked))
+        return self._collect(self._asked, timeout)
+
+    def _collect(self, token=None, timeout=0.):
+        """
+        Goes through the replies of the host, forgetting recorders whose
+        windows have been closed, until the reply with the given token
+        comes up or the timeout passes. Returns the reply, or None.
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                kind, content = self.replies.get(
+                    timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                return None
+            if kind == 'closed':
+                self._hosted.pop(content, None)
+                self._set_policy()
+            elif token is not None and kind == token:
+                return content
+
+    def _set_policy(self):
+        # the strictest policy of the hosted recorders
+        policies = set(cls.backpressure for cls in self._hosted.values())
+        if 'block' in policies:
+            self.backpressure = 'block'
+        elif len(policies) == 1:
+            self.backpressure = policies.pop()
+        else:
+            self.backpressure = None
+        # and the profiles if any of them wants those
+        self.profiles = any(cls.profiles for cls in self._hosted.values())
+
+    # host process side
+
+    def _guard(self, rec, func, *args):
+        """
+        Calls a method of a hosted recorder, and records the error if
+        it fails. Returns whether it worked.
+        """
+        try:
+            func(*args)
+            return True
+        except Exception as e:
+            rec.errors += 1
+            rec.last_error = '%s: %s' % (e.__class__.__name__, e)
+            if rec.errors == 1:
+                # the rest are counted by health()
+                print('%s: %s failed, %s' % (self.name, rec.name,
+                                              rec.last_error))
+            return False
+
+    def _add(self, cmd):
+        name = cmd['name']
+        if name in self.plugins:
+            self._drop(name)
+        try:
+            rec = cmd['cls'](*cmd['args'], name=name, **cmd['kwargs'])
+        except Exception as e:
+            print('%s: could not create %s, %s' % (self.name, name, e))
+            self.replies.put((cmd['token'], False))
+            return
+        rec.errors = 0
+        rec.last_error = None
+        rec.last_seen = None
+        rec.next_check = time.time() + rec.check_interval
+        if not self._guard(rec, rec._setup if rec.gui else rec.init):
+            self.replies.put((cmd['token'], False))
+            return
+        if rec.gui:
+            import matplotlib.pyplot as plt
+            plt.show(block=False)
+        self.plugins[name] = rec
+        self.replies.put((cmd['token'], True))
+
+    def _remove(self, cmd):
+        if cmd['name'] in self.plugins:
+            self._drop(cmd['name'])
+        else:
+            print('%s: no recorder called %s' % (self.name, cmd['name']))
+
+    def _drop(self, name, closed=False):
+        rec = self.plugins.pop(name)
+        self._guard(rec, rec._close)
+        if closed:
+            # tell the main process, which only knows what it added
+            self.replies.put(('closed', name))
+
+    def _health(self, cmd):
+        def fmt(t):
+            return None if t is None else t * 1e3
+        now = time.time()
+        report = OrderedDict()
+        for name, rec in self.plugins.items():
+            m = rec.metrics
+            report[name] = {
+                'class': rec.__class__.__name__,
+                'handled': int(m['handled']),
+                'idle': None if rec.last_seen is None else now - rec.last_seen,
+                'p50': fmt(m.percentile(50)),
+                'p99': fmt(m.percentile(99)),
+                'errors': rec.errors,
+                'last_error': rec.last_error}
+        self.replies.put((cmd['token'], report))
+
+    def _handle(self, dct):
+        """
+        Passes one message on to all hosted recorders, or acts on a
+        ``HostCommand``.
+        """
+        if isinstance(dct, HostCommand):
+            getattr(self, '_' + dct['command'])(dct)
+            return
+        if dct is None:
+            self.quit = True
+            return
+        recs = list(self.plugins.values())
+        if isinstance(dct, RecorderProfile):
+            recs = [r for r in recs if r.profiles]
+        # the shared arrays are attached once, for all recorders
+        shared = SharedMemory.attach(
+            dct, copy=not all(r.zero_copy for r in recs))
+        try:
+            for i, rec in enumerate(recs):
+                t0 = time.time()
+                msg = dct if i == len(recs) - 1 else _copy(dct)
+                self._guard(rec, rec._handle, msg)
+                rec.last_seen = time.time()
+                rec.metrics.add_time(rec.last_seen - t0)
+                rec.metrics['handled'] += 1
+        finally:
+            SharedMemory.release(shared, self.name)
+
+    def run(self):
+        """
+        The main loop of the host.
+        """
+        # ignore SIGINT signals from ctrl-C in the main process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.init()
+        while not self.quit:
+            gui = [r for r in self.plugins.values() if r.gui]
+            checks = [r.next_check for r in self.plugins.values()]
+            wait = min(checks + [time.time() + self.check_interval])
+            if gui:
+                # come back soon for the GUI events
+                wait = min(wait, time.time() + self.gui_interval)
+            self._process_queue(timeout=max(wait - time.time(), 0))
+            for rec in list(self.plugins.values()):
+                if rec.gui:
+                    self._guard(rec, rec._refresh)
+                if time.time() >= rec.next_check:
+                    self._guard(rec, rec.periodic_check)
+                    rec.next_check = time.time() + rec.check_interval
+            if gui:
+                import matplotlib.pyplot as plt
+                for rec in gui:
+                    if not plt.fignum_exists(rec.fig.number):
+                        self._drop(rec.name, closed=True)
+                    else:
+                        rec.fig.canvas.flush_events()
+        for name in list(self.plugins):
+            self._drop(name)
+        self._close()
+
+
+def active_hosts():
+    """
+    Returns a list of the running ``RecorderHost`` objects.
+    """
+    return [r for r in active_recorders() if isinstance(r, RecorderHost)]
+
+
+@macro
+class LsHost(object):
+    """
+    List the recorders in running recorder hosts, with the number of
+    handled messages, the time since the last one, the median and 99th
+    percentile processing times, and the number of errors with the
+    last one.
+    """
+    def run(self):
+        def fmt(t):
+            return '-' if t is None else '<%g' % t
+        for host in active_hosts():
+            report = host.health()
+            if report is None:
+                print('%s is not answering' % host.name)
+                continue
+            table = []
+            for name, h in report.items():
+                table.append([name, h['class'], '%d' % h['handled'],
+                              '-' if h['idle'] is None else '%.1f' % h['idle'],
+                              '%s / %s' % (fmt(h['p50']), fmt(h['p99'])),
+                              '%d' % h['errors'], str(h['last_error'] or '')])
+            titles = ['name', 'class', 'handled', 'idle (s)',
+                      'time p50/p99 (ms)', 'errors', 'last error']
+            print('%s:' % host.name)
+            print(utils.list_to_table(lst=table, titles=titles))
@@ -0,0 +1,259 @@
+"""
+Provides a shared memory transport for large arrays, so that they
+are copied once into a ring buffer instead of being pickled through the
+queue of every recorder. The recorders get small ``SharedArray``
+descriptors in their place, which are resolved before the data reach
+``act_on_data``.
+"""
+
+from collections import deque
+import atexit
+import sys
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python < 3.8
+    shared_memory = None
+
+try:
+    from multiprocessing import resource_tracker
+except ImportError:
+    resource_tracker = None
+
+# attached blocks in this process, by name
+_blocks = {}
+
+
+def _attach(name):
+    """
+    Attaches to a block without registering it with the resource
+    tracker, which only the owner of the ring should do. Otherwise the
+    block is unlinked, or warned about, once more at exit (bpo-39959),
+    and unregistering it afterwards would drop the registration of the
+    owner, whose tracker the recorders share.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    if resource_tracker is None:
+        return shared_memory.SharedMemory(name=name)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _block(name):
+    if name not in _blocks:
+        _blocks[name] = _attach(name)
+    return _blocks[name]
+
+
+class SharedArray(object):
+    """
+    Descriptor of an array in a ``SharedRing``, which is what the
+    recorders receive instead of the array itself.
+    """
+    def __init__(self, block, table, slot, offset, shape, dtype, readers):
+        self.block = block
+        self.table = table
+        self.slot = slot
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+        self.readers = readers
+
+    def array(self, copy=True):
+        """
+        The array, as a copy or as a view which is only valid until
+        the descriptor has been released.
+        """
+        arr = np.ndarray(self.shape, dtype=self.dtype,
+                         buffer=_block(self.block).buf, offset=self.offset)
+        return arr.copy() if copy else arr
+
+    def release(self, reader):
+        """
+        Tells the owner of the ring that reader is done with the array.
+        """
+        flags = _block(self.table).buf
+        flags[self.slot * SharedRing.max_readers
+              + self.readers.index(reader)] = 0
+
+
+class SharedRing(object):
+    """
+    Ring buffer in shared memory, owned by the process which runs the
+    scans. Each array placed in the ring gets a slot with one release
+    flag per reader, and the space is reused once all readers of the
+    oldest arrays have released them. Arrays which don't fit are left
+    in the message and pickled as usual. ::
+
+        SoftwareScan.shared_memory = SharedRing(512e6)
+
+    Without ``multiprocessing.shared_memory`` (python < 3.8), all arrays
+    are left in the messages.
+    """
+    max_readers = 32
+    align = 64
+
+    def __init__(self, capacity=256e6, slots=4096, threshold=64 * 1024):
+        """
+        :param capacity: Size of the ring in bytes
+        :type capacity: int
+        :param slots: Maximum number of arrays in the ring at once
+        :type slots: int
+        :param threshold: Smallest array in bytes to place in the ring
+        :type threshold: int
+        """
+        self.capacity = int(capacity)
+        self.threshold = threshold
+        if shared_memory is None:
+            print('shared memory needs python 3.8, pickling arrays instead')
+            self.data = None
+            return
+        self.data = shared_memory.SharedMemory(create=True,
+                                               size=self.capacity)
+        self.table = shared_memory.SharedMemory(
+            create=True, size=slots * self.max_readers)
+        self.flags = np.ndarray((slots, self.max_readers), dtype=np.uint8,
+                                buffer=self.table.buf)
+        self.flags[:] = 0
+        self.free = deque(range(slots))
+        self.live = deque()  # (slot, offset, nbytes, readers), oldest first
+        self.head = 0
+        atexit.register(self.close)
+
+    def _reclaim(self, alive=None):
+        """
+        Frees the oldest allocations which all readers have released.
+        If the names of the living readers are given, readers which
+        have disappeared are released first.
+        """
+        if alive is not None:
+            for slot, _, _, readers in self.live:
+                for j, name in enumerate(readers):
+                    if name not in alive:
+                        self.flags[slot, j] = 0
+        while self.live and not self.flags[self.live[0][0]].any():
+            self.free.append(self.live.popleft()[0])
+        if not self.live:
+            self.head = 0
+
+    def _allocate(self, nbytes):
+        """
+        Finds room for nbytes after the newest allocation, or returns
+        None if there is none.
+        """
+        if not self.free:
+            return None
+        if not self.live:
+            return 0 if nbytes <= self.capacity else None
+        tail = self.live[0][1]
+        if self.head > tail:
+            if self.head + nbytes <= self.capacity:
+                return self.head
+            return 0 if nbytes <= tail else None
+        return self.head if self.head + nbytes <= tail else None
+
+    def put(self, arr, readers, alive=None):
+        """
+        Copies an array into the ring.
+
+        :param arr: The array
+        :param readers: Names of the recorders which will read it
+        :param alive: Names of the living recorders, used to free up
+                      space which is full
+        :returns: A ``SharedArray``, or None if the array doesn't fit
+        """
+        arr = np.ascontiguousarray(arr)
+        self._reclaim()
+        offset = self._allocate(arr.nbytes)
+        if offset is None and alive is not None:
+            self._reclaim(alive)
+            offset = self._allocate(arr.nbytes)
+        if offset is None:
+            return None
+        slot = self.free.popleft()
+        self.flags[slot] = 0
+        self.flags[slot, :len(readers)] = 1
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self.data.buf,
+                          offset=offset)
+        view[...] = arr
+        end = offset + arr.nbytes
+        self.head = end + (-end % self.align)
+        self.live.append((slot, offset, arr.nbytes, readers))
+        return SharedArray(self.data.name, self.table.name, slot, offset,
+                           arr.shape, arr.dtype.str, readers)
+
+    def share(self, dct, readers, alive=None):
+        """
+        Returns a copy of a data dict, where the large arrays are
+        replaced by ``SharedArray`` descriptors. Dict values are
+        treated recursively.
+        """
+        if self.data is None or len(readers) > self.max_readers:
+            return dct
+        out = type(dct)()
+        for key, val in dct.items():
+            if type(val) == dict:
+                val = self.share(val, readers, alive)
+            elif (isinstance(val, np.ndarray) and val.nbytes >= self.threshold
+                  and not val.dtype.hasobject):
+                val = self.put(val, readers, alive) or val
+            out[key] = val
+        return out
+
+    def close(self):
+        """
+        Releases the shared memory.
+        """
+        if self.data is None:
+            return
+        for shm in (self.data, self.table):
+            try:
+                shm.close()
+                shm.unlink()
+            except (FileNotFoundError, BufferError):
+                pass
+
+
+def attach(dct, copy=True):
+    """
+    Replaces the ``SharedArray`` descriptors in a received data dict by
+    the arrays, in place, and returns the descriptors so that they can
+    be released afterwards.
+    """
+    found = []
+    for key, val in dct.items():
+        if isinstance(val, SharedArray):
+            dct[key] = val.array(copy)
+            found.append(val)
+        elif type(val) == dict:
+            found += attach(val, copy)
+    return found
+
+
+def descriptors(dct):
+    """
+    Returns the ``SharedArray`` descriptors in a data dict, without
+    resolving them.
+    """
+    found = []
+    for val in dct.values():
+        if isinstance(val, SharedArray):
+            found.append(val)
+        elif type(val) == dict:
+            found += descriptors(val)
+    return found
+
+
+def release(descriptors, reader):
+    """
+    Releases a list of descriptors from ``attach``.
+    """
+    for d in descriptors:
+        d.release(reader)
@@ -1,5 +1,11 @@
 from . import Recorder, RecorderFooter
 from .Hdf5Recorder import Link
+import h5py
+import json
+import pickle
+import numpy as np
+from collections import deque
+import threading
 import time
 import subprocess
 
@@ -16,6 +22,65 @@ def walk_dict(dct):
                 yield d_, k_, v_
 
 
+def encode(dct):
+    """
+    Encodes a message in the binary wire format, as a list of frames.
+    The first frame is a JSON document of the message, where each array
+    is replaced by ``{"__array__": i, "dtype": ..., "shape": [...]}``
+    and its raw data is sent as frame i + 1. Links become dicts like
+    in the pickle format, and numpy scalars become numbers.
+    """
+    buffers = []
+
+    def convert(val):
+        if isinstance(val, dict):
+            return {str(k): convert(v) for k, v in val.items()}
+        elif isinstance(val, np.ndarray) and not val.dtype.hasobject:
+            buffers.append(np.ascontiguousarray(val))
+            return {'__array__': len(buffers) - 1,
+                    'dtype': val.dtype.str,
+                    'shape': list(val.shape)}
+        elif isinstance(val, np.generic):
+            return val.item()
+        elif isinstance(val, h5py.ExternalLink):
+            return {'type': 'Link',
+                    'filename': val.filename,
+                    'path': val.path,
+                    'universal': getattr(val, 'universal', False)}
+        elif isinstance(val, bytes):
+            return val.decode(errors='replace')
+        elif isinstance(val, (list, tuple)):
+            return [convert(v) for v in val]
+        elif val is None or isinstance(val, (bool, int, float, str)):
+            return val
+        return str(val)
+
+    header = json.dumps(convert(dct)).encode()
+    return [header] + buffers
+
+
+def decode(frames):
+    """
+    Decodes a message in the binary wire format, from a list of frames
+    as received with ``socket.recv_multipart(copy=False)`` or as bytes.
+    The arrays are read-only views of the received buffers.
+    """
+    buffers = [getattr(f, 'buffer', f) for f in frames[1:]]
+
+    def convert(val):
+        if isinstance(val, dict):
+            if '__array__' in val:
+                return np.frombuffer(buffers[val['__array__']],
+                                     dtype=val['dtype']).reshape(val['shape'])
+            return {k: convert(v) for k, v in val.items()}
+        elif isinstance(val, list):
+            return [convert(v) for v in val]
+        return val
+
+    return convert(json.loads(bytes(getattr(frames[0], 'buffer',
+                                            frames[0]))))
+
+
 class StreamRecorder(Recorder):
     """
     Recorder which publishes data to a zmq stream. Try receiving it with::
@@ -51,19 +116,92 @@ class StreamRecorder(Recorder):
          'dt': 2.3689677715301514,
          'status': 'running'}
 
+    With ``wire='binary'``, the messages are instead sent as multipart
+    messages of a JSON header and the raw buffers of the arrays (see
+    ``encode``), which is faster for large arrays and can be read
+    without python. From python, use ``decode``::
+
+        from contrast.recorders.StreamRecorder import decode
+        messagedata = decode(socket.recv_multipart(copy=False))
+
+    With ``topics=True``, every message starts with a topic frame, so
+    that subscribers only get what they ask for. Headers, footers and
+    heartbeats are published on the ``control`` topic, and data
+    messages are split up per top-level key, under topics like
+    ``scan.<scannr>.<key>``. Each part holds the key, the index of the
+    point within the scan as ``'point'``, and the status. Since zmq
+    matches topics by prefix, subscribing to ``scan.12.det1`` also gives
+    ``scan.12.det10``. ::
+
+        socket.setsockopt(zmq.SUBSCRIBE, b"control")
+        socket.setsockopt(zmq.SUBSCRIBE, b"scan.12.det1")
+        topic, payload = socket.recv_multipart()
+        messagedata = pickle.loads(payload)
+
+    Clients which connect during a scan can catch up by asking for the
+    state of the stream on the replay port, if there is one. The reply
+    is a single message in the same format as the stream (without a
+    topic), with the header of the current scan, the last points, and
+    the footer if the scan is over. ::
+
+        req = context.socket(zmq.REQ)
+        req.connect("tcp://localhost:5557")
+        req.send(b"state")
+        state = req.recv_pyobj()
+        state['header'], state['points'], state['footer']
     """
+    control_topic = 'control'
 
     try:
         import zmq
     except ImportError:
         zmq = None
 
-    def __init__(self, name=None, port=5556):
+    def __init__(self, name=None, port=5556, wire='pickle', topics=False,
+                 replay_port=None, replay=100):
+        """
+        :param port: Port to publish on
+        :type port: int
+        :param wire: Message format, 'pickle' or 'binary'
+        :type wire: str
+        :param topics: Whether to publish under topics
+        :type topics: bool
+        :param replay_port: Port for the state of the stream, or None
+        :type replay_port: int
+        :param replay: Number of recent points to keep for the replay
+        :type replay: int
+        """
         super(StreamRecorder, self).__init__(name=name)
+        if wire not in ('pickle', 'binary'):
+            raise ValueError("wire has to be 'pickle' or 'binary'")
         self.last_heartbeat = time.time()
         self.port = port
+        self.wire = wire
+        self.topics = topics
+        self.scannr = None
+        self.point = 0
+        self.replay_port = replay_port
+        self.replay = replay
+        self.header = None
+        self.recent = deque(maxlen=replay)
+        self.footer = None
+
+    def _encode(self, dct):
+        if self.wire == 'binary':
+            return encode(dct)
+        return [pickle.dumps(dct, protocol=2)]
+
+    def _send(self, dct, topic=None):
+        """
+        Publishes a message in the chosen format, under a topic if
+        topics are used.
+        """
+        frames = self._encode(dct)
+        if self.topics:
+            frames = [(topic or self.control_topic).encode()] + frames
+        self.socket.send_multipart(frames, copy=False)
 
-    def run(self):
+    def init(self):
         zmq = self.zmq
         context = zmq.Context()
         self.socket = context.socket(zmq.PUB)
@@ -81,7 +219,33 @@ class StreamRecorder(Recorder):
                 print('...failed to find PID or kill process, giving up. This StreamRecorder won''t run.')
             except zmq.ZMQError:
                 print('...still could not bind to port. Giving up.')
-        super(StreamRecorder, self).run()
+        # the cache is shared with the replay thread
+        self._lock = threading.Lock()
+        if self.replay_port is not None:
+            threading.Thread(target=self._serve, args=(context,),
+                             daemon=True).start()
+
+    def _serve(self, context):
+        """
+        Answers requests for the state of the stream, in a thread of
+        its own so that new clients don't have to wait for the queue.
+        """
+        zmq = self.zmq
+        socket = context.socket(zmq.REP)
+        try:
+            socket.bind("tcp://*:%s" % self.replay_port)
+        except zmq.ZMQError:
+            print('%s could not bind to port %u, no replay available.'
+                  % (self.name, self.replay_port))
+            return
+        while True:
+            socket.recv()
+            with self._lock:
+                state = {'status': 'state',
+                         'header': self.header,
+                         'points': list(self.recent),
+                         'footer': self.footer}
+            socket.send_multipart(self._encode(state), copy=False)
 
     def act_on_header(self, dct):
         """
@@ -90,7 +254,14 @@ class StreamRecorder(Recorder):
         Converts RecorderHeader to plain dict so the receiver doesn't
         need the contrast library.
         """
-        self.socket.send_pyobj(dict(dct), protocol=2)
+        self.scannr = dct['scannr']
+        self.point = 0
+        if self.replay_port is not None:
+            with self._lock:
+                self.header = dict(dct)
+                self.recent.clear()
+                self.footer = None
+        self._send(dict(dct))
 
     def act_on_data(self, dct, base='entry/measurement/'):
         """
@@ -103,16 +274,31 @@ class StreamRecorder(Recorder):
                         'path': v.path,
                         'universal': v.universal}
         dct['status'] = 'running'
-        self.socket.send_pyobj(dct, protocol=2)
+        if self.topics:
+            for key, val in dct.items():
+                if key == 'status':
+                    continue
+                self._send({key: val, 'point': self.point,
+                            'status': 'running'},
+                           topic='scan.%s.%s' % (self.scannr, key))
+        else:
+            self._send(dct)
+        if self.replay_port is not None:
+            with self._lock:
+                self.recent.append(dct)
+        self.point += 1
 
     def act_on_footer(self, dct):
         """
         Relay information.
         """
-        self.socket.send_pyobj(dict(dct), protocol=2)
+        if self.replay_port is not None:
+            with self._lock:
+                self.footer = dict(dct)
+        self._send(dict(dct))
 
     def periodic_check(self):
         check_time = time.time()
         if check_time - self.last_heartbeat > 10.:
-            self.socket.send_pyobj({'status': 'heartbeat'})
+            self._send({'status': 'heartbeat'})
             self.last_heartbeat = check_time
@@ -7,11 +7,15 @@ import os
 import signal
 import atexit
 from .Recorder import Recorder, DummyRecorder, active_recorders
-from .Recorder import RecorderHeader, RecorderFooter
+from .Recorder import RecorderHeader, RecorderFooter, RecorderProfile
 from .PlotRecorder import PlotRecorder
+from .MapRecorder import MapRecorder
 from .Hdf5Recorder import Hdf5Recorder
 from .StreamRecorder import StreamRecorder
+from .ArrowRecorder import ArrowRecorder
 from .ScicatRecorder import ScicatRecorder
+from .SharedMemory import SharedRing
+from .RecorderHost import RecorderHost
 
 
 def kill_all_recorders():
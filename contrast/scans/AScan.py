@@ -1,8 +1,8 @@
-from .Scan import SoftwareScan
+from .Scan import SoftwareScan, PositionPlan
 from ..environment import macro, MacroSyntaxError
 from ..motors import all_are_motors
+from ..utils import wait_all_done
 import numpy as np
-import time
 
 
 @macro
@@ -30,14 +30,11 @@ class AScan(SoftwareScan):
         except:
             raise MacroSyntaxError
 
-    def _generate_positions(self):
-        positions = []
-        for i in range(len(self.motors)):
-            positions.append(np.linspace(self.limits[i][0],
-                                         self.limits[i][1],
-                                         self.intervals + 1))
-        for i in range(len(positions[0])):
-            yield {m.name: pos[i] for (m, pos) in zip(self.motors, positions)}
+    def _generate_plan(self):
+        positions = np.linspace([l_[0] for l_ in self.limits],
+                                [l_[1] for l_ in self.limits],
+                                self.intervals + 1)
+        return PositionPlan([m.name for m in self.motors], positions)
 
     def _before_arm(self):
         for m in self.motors:
@@ -53,22 +50,18 @@ class DScan(AScan):
 
         dscan <motor1> <start> <stop> <intervals> ... <exp_time>
     """
-    def _generate_positions(self):
-        current = {m.name: m.position() for m in self.motors}
-        for pos in super(DScan, self)._generate_positions():
-            for i, m in enumerate(self.motors):
-                pos[m.name] += current[m.name]
-            yield pos
+    def _generate_plan(self):
+        plan = super(DScan, self)._generate_plan()
+        plan.positions += [m.position() for m in self.motors]
+        return plan
 
     def run(self):
         old_pos = [m.position() for m in self.motors]
         super(DScan, self).run()
         # wait for motors then move them back
-        while True in [m.busy() for m in self.motors]:
-            time.sleep(.01)
+        wait_all_done(self.motors)
         print('Returning motors to their starting positions...')
         for m, pos in zip(self.motors, old_pos):
             m.move(pos)
-        while True in [m.busy() for m in self.motors]:
-            time.sleep(.01)
+        wait_all_done(self.motors)
         print('...done')
@@ -1,12 +1,67 @@
-from .Scan import SoftwareScan
+from .Scan import SoftwareScan, PositionPlan
 from ..environment import macro, MacroSyntaxError
 from ..motors import all_are_motors
+from ..utils import wait_all_done
+from .Trajectory import optimize_path
 import numpy as np
-import time
 
 import matplotlib.pyplot as plt
 
 
+def grid_indices(shape, snake=False, order=None):
+    """
+    Returns the logical indices of all points on a grid, as an
+    (N_points x N_axes) array in the order the points are visited.
+
+    :param shape: Number of points along each axis
+    :type shape: list, tuple
+    :param snake: Run the faster axes back and forth instead of
+                  returning to their starts, for any number of axes
+    :type snake: bool
+    :param order: Axes from the slowest to the fastest, by default the
+                  first axis is the slowest
+    :type order: list, tuple
+    """
+    ndim = len(shape)
+    order = list(range(ndim)) if order is None else list(order)
+    shape = [int(shape[k]) for k in order]
+    counters = np.indices(shape).reshape((ndim, -1)).T
+    indices = counters.copy()
+    if snake:
+        for k in range(1, ndim):
+            # reverse axis k on every other pass of the slower axes
+            line = np.ravel_multi_index(tuple(counters[:, :k].T), shape[:k])
+            odd = (line % 2 == 1)
+            indices[odd, k] = shape[k] - 1 - counters[odd, k]
+    result = np.empty_like(indices)
+    result[:, order] = indices
+    return result
+
+
+def mesh_order(ndim):
+    """
+    The axis order which meshes have always used, from the slowest to
+    the fastest axis. With two axes the first is the slowest, with more
+    the second and third come first and the first axis is the fastest,
+    as given by ``np.meshgrid`` on the reversed positions.
+    """
+    if ndim < 3:
+        return list(range(ndim))
+    return [ndim - 2, ndim - 1] + list(range(ndim - 3, -1, -1))
+
+
+def parse_order(order, motors):
+    """
+    Turns an axis order given as motors or motor indices into a list
+    of indices.
+    """
+    if order is None:
+        return None
+    order = [o if isinstance(o, int) else motors.index(o) for o in order]
+    assert sorted(order) == list(range(len(motors)))
+    return order
+
+
 @macro
 class Mesh(SoftwareScan):
     """
@@ -16,6 +71,16 @@ class Mesh(SoftwareScan):
 
     optional keyword arguments:
         jitter: float ... Randomizes perfect grid positions.
+        snake: bool ... Runs the faster axes back and forth.
+        order: list ... Axes from the slowest to the fastest, as motor
+                        indices like order=[0,1,2]. By default the
+                        first motor is the slowest of two, and the
+                        fastest of three or more, see mesh_order.
+        skip_unchanged: bool ... Only moves motors whose positions
+                                 change, so the slow axes don't settle
+                                 on every point.
+
+    The grid indices of each point are recorded as ``grid_index``.
     """
 
     def __init__(self, *args, **kwargs):
@@ -35,17 +100,24 @@ class Mesh(SoftwareScan):
             self.n_positions = np.prod(np.array(self.intervals) + 1)
             assert all_are_motors(self.motors)
             assert (len(args) - 1) % 4 == 0
+            self.snake = bool(kwargs.get('snake', False))
+            self.order = parse_order(kwargs.get('order'), self.motors)
+            self.skip_unchanged = bool(kwargs.get('skip_unchanged', False))
         except:
             raise MacroSyntaxError
 
-    def _generate_positions(self):
+    def _generate_plan(self):
         positions = []
         for i in range(len(self.motors)):
             positions.append(np.linspace(self.limits[i][0],
                                          self.limits[i][1],
                                          self.intervals[i] + 1))
-        grids = np.meshgrid(*reversed(positions))
-        grids = [l_ for l_ in reversed(grids)]  # fastest last
+        order = self.order
+        if order is None:
+            order = mesh_order(len(positions))
+        indices = grid_indices([len(p) for p in positions],
+                               snake=self.snake, order=order)
+        grids = [p[indices[:, i]] for i, p in enumerate(positions)]
 
         if 'jitter' in self.kwargs.keys():
             print('[!] jittered grid postions by factor:',
@@ -64,8 +136,8 @@ class Mesh(SoftwareScan):
                 for i, step_size in enumerate(step_sizes):
                     grids[i] += rel_jitter[i] * step_size
 
-        for i in range(len(grids[0].flat)):
-            yield {m.name: pos.flat[i] for (m, pos) in zip(self.motors, grids)}
+        return PositionPlan([m.name for m in self.motors],
+                            np.column_stack(grids), indices)
 
     def _before_arm(self):
         for m in self.motors:
@@ -80,24 +152,20 @@ class DMesh(Mesh):
 
         dmesh <motor1> <start> <stop> <intervals> ... <exp_time>
     """
-    def _generate_positions(self):
-        current = {m.name: m.position() for m in self.motors}
-        for pos in super(DMesh, self)._generate_positions():
-            for i, m in enumerate(self.motors):
-                pos[m.name] += current[m.name]
-            yield pos
+    def _generate_plan(self):
+        plan = super(DMesh, self)._generate_plan()
+        plan.positions += [m.position() for m in self.motors]
+        return plan
 
     def run(self):
         old_pos = [m.position() for m in self.motors]
         super(DMesh, self).run()
         # wait for motors then move them back
-        while True in [m.busy() for m in self.motors]:
-            time.sleep(.01)
+        wait_all_done(self.motors)
         print('Returning motors to their starting positions...')
         for m, pos in zip(self.motors, old_pos):
             m.move(pos)
-        while True in [m.busy() for m in self.motors]:
-            time.sleep(.01)
+        wait_all_done(self.motors)
         print('...done')
 
 @macro
@@ -116,6 +184,14 @@ class MeshJMesh(SoftwareScan):
     while the start and stop positions of the submesh are relative coordiantes.
 
     2nd axis is the fast axis.
+
+    optional keyword arguments:
+        snake, order, skip_unchanged: As for mesh, applied to the coarse
+                                      mesh and to each submesh.
+        optimize: bool or float ... Finds a short path through all
+                                    points instead, a number gives the
+                                    time budget in seconds.
+        plot: bool ... Plots the positions.
     """
 
     def __init__(self, m1, l1_l, l1_u, n1, j1, sl1_l, sl1_u, sn1, sj1, 
@@ -148,6 +224,9 @@ class MeshJMesh(SoftwareScan):
             self.kwargs = kwargs
 
             self.motors = [m1, m2]
+            self.snake = bool(kwargs.get('snake', False))
+            self.order = parse_order(kwargs.get('order'), self.motors)
+            self.skip_unchanged = bool(kwargs.get('skip_unchanged', False))
             self.limits = [[l1_l+sl1_l, l1_u+sl1_u], [l2_l+sl2_l, l2_u+sl2_u]]
 
             self.calc_positions()
@@ -174,32 +253,39 @@ class MeshJMesh(SoftwareScan):
         print(stepsize_2_fine)
 
         # calculate the absolute coarse mesh grid
-        p12_coarse = []
-        for i, p1 in enumerate(grid_1_coarse):
-            for j, p2 in enumerate(grid_2_coarse):
-                p12_coarse.append([p1, p2])
-        p12_coarse = np.array(p12_coarse)
+        coarse = grid_indices((self.n1 + 1, self.n2 + 1),
+                              snake=self.snake, order=self.order)
+        p12_coarse = np.column_stack([grid_1_coarse[coarse[:, 0]],
+                                      grid_2_coarse[coarse[:, 1]]])
 
         # put the coarse jitter on the the coarse mesh grid
         rjc = np.random.uniform(low=-.5, high=.5, size=np.shape(p12_coarse))
-        for i, p12 in enumerate(p12_coarse):
-            p12_coarse[i] = [p12[0] + rjc[i,0] * self.j1 * stepsize_1_coarse,
-                             p12[1] + rjc[i,1] * self.j2 * stepsize_2_coarse]
+        p12_coarse += rjc * [self.j1 * stepsize_1_coarse,
+                             self.j2 * stepsize_2_coarse]
 
         # calculate the fine grid on top of that coarse mesh grid
-        p12_fine = []
-        for k, pc in enumerate(p12_coarse):
-            p1c, p2c = pc
-            for i, p1 in enumerate(grid_1_fine):
-                for j, p2 in enumerate(grid_2_fine):
-                    p12_fine.append([p1c + p1, p2c + p2])
-        p12_fine = np.array(p12_fine)
+        fine = grid_indices((self.sn1 + 1, self.sn2 + 1),
+                            snake=self.snake, order=self.order)
+        p12_sub = np.column_stack([grid_1_fine[fine[:, 0]],
+                                   grid_2_fine[fine[:, 1]]])
+        p12_fine = (p12_coarse[:, None, :] + p12_sub[None, :, :])
+        p12_fine = p12_fine.reshape((-1, 2))
 
         # put the fine jitter on the the fine mesh grid
         rjf = np.random.uniform(low=-.5, high=.5, size=np.shape(p12_fine))
-        for i, p12 in enumerate(p12_fine):
-            p12_fine[i] = [p12[0] + rjf[i,0] * self.sj1 * stepsize_1_fine,
-                           p12[1] + rjf[i,1] * self.sj2 * stepsize_2_fine]
+        p12_fine += rjf * [self.sj1 * stepsize_1_fine,
+                           self.sj2 * stepsize_2_fine]
+
+        # coarse and fine grid indices of each point
+        self.indices = np.hstack([np.repeat(coarse, len(fine), axis=0),
+                                  np.tile(fine, (len(coarse), 1))])
+
+        # optionally find a shorter path through all the points
+        if self.kwargs.get('optimize', False):
+            best_path = optimize_path(
+                p12_fine, time_budget=float(self.kwargs['optimize']))
+            p12_fine = p12_fine[best_path]
+            self.indices = self.indices[best_path]
 
         # plot the positions if requested
         if 'plot' in self.kwargs.keys():
@@ -227,10 +313,9 @@ class MeshJMesh(SoftwareScan):
         # return the positions
         self.pos_12 = p12_fine
 
-    def _generate_positions(self):
-        for i, pos in enumerate(self.pos_12):
-            yield {self.motors[0].name: pos[0],
-                   self.motors[1].name: pos[1]}
+    def _generate_plan(self):
+        return PositionPlan([m.name for m in self.motors], self.pos_12,
+                            self.indices)
 
 @macro
 class ListScan(SoftwareScan):
@@ -240,11 +325,18 @@ class ListScan(SoftwareScan):
     The position lists must be given as python lists, but without any spaces.
         
         listscan <motor1> <position_list> ...  <exp_time>
+
+    optional keyword arguments:
+        optimize: bool or float ... Visits the positions along a short
+                                    path, starting from the first one.
+                                    A number gives the time budget in
+                                    seconds.
     """
 
     def __init__(self, *args, **kwargs):
         self.motors = []
         self.pos_lists = []
+        self.optimize = kwargs.get('optimize', False)
         try:
             exposuretime = float(args[-1])
             super(ListScan, self).__init__(exposuretime)
@@ -258,9 +350,12 @@ class ListScan(SoftwareScan):
         except:
             raise MacroSyntaxError
 
-    def _generate_positions(self):
-        for i in range(len(self.pos_lists[0])):
-            yield {m.name: pos[i] for (m, pos) in zip(self.motors, self.pos_lists)}
+    def _generate_plan(self):
+        positions = np.column_stack(self.pos_lists)
+        if self.optimize:
+            positions = positions[optimize_path(
+                positions, time_budget=float(self.optimize))]
+        return PositionPlan([m.name for m in self.motors], positions)
 
     def check_length_postlists(self):
         lengths = [len(x) for x in self.pos_lists]
@@ -0,0 +1,323 @@
+"""
+Provides timing of the individual phases of scan points, a model for
+predicting the duration of scans, and a macro for summarizing the
+timing of the last scan.
+"""
+
+from ..environment import macro
+from .. import utils
+from collections import OrderedDict
+import numpy as np
+import threading
+import time
+
+
+class PointProfile(OrderedDict):
+    """
+    Wall-clock durations (in seconds) of the phases of one scan point.
+    Phases which are timed per gadget, like reading the detectors, are
+    stored as dicts keyed on the gadget name. ::
+
+        prof = PointProfile()
+        prof.tic()
+        do_something()
+        prof.toc('something')
+        prof.tic()
+        det.read()
+        prof.toc('read', det.name)
+    """
+    def __init__(self, *args, clock=time, profiler=None, **kwargs):
+        super(PointProfile, self).__init__(*args, **kwargs)
+        self._clock = clock
+        self._profiler = profiler
+        self._t = clock.time()
+        self.started = self._t
+
+    def tic(self):
+        """
+        Starts timing a new phase.
+        """
+        self._t = self._clock.time()
+
+    def toc(self, phase, gadget=None):
+        """
+        Stores the time since the last tic() under phase, or under
+        phase/gadget, and starts timing the next phase.
+        """
+        now = self._clock.time()
+        if gadget is None:
+            self[phase] = now - self._t
+        else:
+            self.setdefault(phase, {})[gadget] = now - self._t
+        if self._profiler is not None:
+            self._profiler._count(phase, gadget, now - self._t)
+        self._t = now
+
+
+class ScanProfiler(object):
+    """
+    Times the points of a scan through ``PointProfile`` objects. The
+    profiler of the most recent scan is available as
+    ``ScanProfiler.last``.
+
+    Running sums of the phase durations and of the overheads are kept
+    up to date as the points are timed, so that the means are cheap
+    to ask for during long scans. The profiles themselves are only kept
+    for a sample of at most max_sample points, spread evenly over the
+    scan, which is what ``durations()`` and ``overheads()`` are
+    based on.
+    """
+
+    last = None
+    max_sample = 10000
+
+    def __init__(self, scannr=None, exposuretime=0., clock=time):
+        self.scannr = scannr
+        self.exposuretime = exposuretime
+        self.clock = clock
+        self.n_points = 0
+        self.sample = []  # every stride'th point
+        self._stride = 1
+        self._previous = None
+        self._sums = OrderedDict()  # (phase, gadget): [total, count]
+        self._overhead = [0., 0]
+        self._lock = threading.Lock()
+        ScanProfiler.last = self
+
+    def new_point(self):
+        """
+        Creates and returns a new ``PointProfile``, and keeps it if it
+        belongs to the sample.
+        """
+        prof = PointProfile(clock=self.clock, profiler=self)
+        prev = self._previous
+        if prev is not None:
+            # the previous point is finished, apart from its readout
+            prev.overhead = self._point_overhead(prev, prof.started)
+            self._overhead[0] += prev.overhead
+            self._overhead[1] += 1
+        if self.n_points % self._stride == 0:
+            self.sample.append(prof)
+            if len(self.sample) > self.max_sample:
+                # thin out, the indices stay evenly spaced
+                self.sample = self.sample[::2]
+                self._stride *= 2
+        self.n_points += 1
+        self._previous = prof
+        return prof
+
+    def _count(self, phase, gadget, duration):
+        with self._lock:
+            total = self._sums.setdefault((phase, gadget), [0., 0])
+            total[0] += duration
+            total[1] += 1
+
+    def _point_overhead(self, prof, next_start):
+        moving = prof.get('before_move', 0.) + prof.get('move', 0.)
+        return max(next_start - prof.started - moving - self.exposuretime,
+                   0.)
+
+    def durations(self):
+        """
+        Returns an OrderedDict of {phase: array of durations} for the
+        sampled points, where per-gadget phases are flattened to
+        'phase/gadget' keys.
+        """
+        result = OrderedDict()
+        for prof in self.sample[:]:
+            for phase, val in prof.items():
+                if isinstance(val, dict):
+                    for gadget, v in val.items():
+                        result.setdefault(phase + '/' + gadget, []).append(v)
+                else:
+                    result.setdefault(phase, []).append(val)
+        return OrderedDict((k, np.array(v)) for k, v in result.items())
+
+    def overheads(self):
+        """
+        Returns an array of the time spent on each finished point of
+        the sample apart from moving motors, ``_before_move`` and the
+        exposure itself. This is measured between the starts of
+        consecutive points, so that readout which overlaps with the
+        next point is not counted.
+        """
+        return np.array([p.overhead for p in self.sample[:]
+                         if hasattr(p, 'overhead')])
+
+    def mean_overhead(self):
+        """
+        Returns the mean overhead of all finished points, see
+        ``overheads()``, or None if no point has finished.
+        """
+        total, count = self._overhead
+        return total / count if count else None
+
+    def mean(self, phase, gadget=None):
+        """
+        Returns the mean duration of a phase, or None if it has not
+        been measured. Points are counted as soon as the phase has been
+        timed.
+        """
+        total, count = self._sums.get((phase, gadget), (0., 0))
+        return total / count if count else None
+
+    def total(self, phase, gadget=None):
+        """
+        Returns the total duration of a phase over all points.
+        """
+        return self._sums.get((phase, gadget), (0., 0))[0]
+
+    def gadgets(self, phase):
+        """
+        Returns the names of the gadgets which a phase has been timed
+        for.
+        """
+        return [g for (p, g) in list(self._sums) if p == phase
+                and g is not None]
+
+
+class TimingModel(object):
+    """
+    Predicts the duration of scan points. Motor movements are estimated
+    with ``Motor.move_time()``, or from the measured movements if some
+    motor has no motion model. The rest of each point (arming, detector
+    overheads, readout...) is learned from the finished points of the
+    scan, or taken from the reference scan until a point has finished.
+    Time spent in ``_before_move``, like waiting for beam, is not
+    included.
+    """
+    def __init__(self, motors, exposuretime, profiler=None, reference=None,
+                 gadgets=None):
+        """
+        :param motors: The motors moved, in the order of the plan columns
+        :type motors: list
+        :param exposuretime: Exposure time per point
+        :type exposuretime: float
+        :param profiler: ``ScanProfiler`` of the scan being predicted
+        :param reference: ``ScanProfiler`` of an earlier scan
+        :param gadgets: Names of the gadgets read out in the scan, so
+                        that the readout of gadgets which only took part
+                        in the reference scan is not counted
+        :type gadgets: list
+        """
+        self.motors = motors
+        self.exposuretime = exposuretime
+        self.profiler = profiler
+        self.reference = reference
+        self.gadgets = gadgets
+        self.move_times = None
+
+    def plan(self, positions, start=None):
+        """
+        Estimates the movements of all points of a ``PositionPlan``.
+
+        :param positions: The plan to estimate
+        :type positions: PositionPlan
+        :param start: Motor positions before the first point, defaults
+                      to the current ones
+        :returns: Array of move times, or None if unknown
+        """
+        self.move_times = None
+        try:
+            if start is None:
+                start = [m.position() for m in self.motors]
+            targets = positions.positions
+            starts = np.vstack([np.reshape(start, (1, -1)), targets])[:-1]
+            times = np.zeros(len(targets))
+            for j, m in enumerate(self.motors):
+                t = m.move_time(targets[:, j], starts[:, j])
+                if t is None:
+                    return None
+                times = np.maximum(times, t)
+        except Exception as e:
+            # an estimate is not worth failing the scan for
+            print('Could not estimate the motor movements: %s' % e)
+            return None
+        self.move_times = times
+        return times
+
+    def _learned(self):
+        """
+        The profiler to learn from, preferring the current scan.
+        """
+        for profiler in (self.profiler, self.reference):
+            if profiler is not None and profiler.n_points > 1:
+                return profiler
+        return None
+
+    def overhead(self):
+        """
+        Predicted time per point apart from movements and exposure.
+        """
+        profiler = self._learned()
+        if profiler is None:
+            return 0.
+        overhead = profiler.mean_overhead()
+        if profiler is self.reference and self.gadgets is not None:
+            # subtract the readout of gadgets that are gone since then
+            for gadget in profiler.gadgets('read'):
+                if gadget not in self.gadgets:
+                    overhead -= profiler.mean('read', gadget) or 0.
+        return max(overhead, 0.)
+
+    def mean_move(self):
+        """
+        Measured mean time per point spent on moving motors.
+        """
+        profiler = self._learned()
+        if profiler is None:
+            return 0.
+        return profiler.mean('move') or 0.
+
+    def point_time(self, i):
+        """
+        Predicts the duration of point i.
+        """
+        if self.move_times is not None and i < len(self.move_times):
+            move = self.move_times[i]
+        else:
+            move = self.mean_move()
+        return move + self.exposuretime + self.overhead()
+
+    def remaining(self, i, n):
+        """
+        Predicts the time needed for the points after point i, out of n
+        points in total. Pass i=-1 for the whole scan.
+        """
+        left = max(n - i - 1, 0)
+        if self.move_times is not None:
+            moves = self.move_times[i + 1:n].sum()
+        else:
+            moves = left * self.mean_move()
+        return moves + left * (self.exposuretime + self.overhead())
+
+
+@macro
+class ScanProfile(object):
+    """
+    Print a summary of the time spent in each phase of the points of
+    the last scan, per phase and per gadget. The 95th percentiles are
+    taken from the sampled points, see ``ScanProfiler``. ::
+
+        scanprofile
+    """
+    def run(self):
+        profiler = ScanProfiler.last
+        if profiler is None or not profiler.n_points:
+            print('No scan has been profiled yet.')
+            return
+        titles = ['phase', 'mean (ms)', 'p95 (ms)', 'total (s)']
+        table = []
+        durations = profiler.durations()
+        for phase, gadget in list(profiler._sums):
+            key = phase if gadget is None else phase + '/' + gadget
+            vals = durations.get(key)
+            p95 = ('-' if vals is None or not len(vals)
+                   else '%.1f' % (np.percentile(vals, 95) * 1e3))
+            table.append([key,
+                          '%.1f' % (profiler.mean(phase, gadget) * 1e3),
+                          p95,
+                          '%.2f' % profiler.total(phase, gadget)])
+        print('\nScan #%s, %d points\n' % (profiler.scannr,
+                                          profiler.n_points))
+        print(utils.list_to_table(lst=table, titles=titles, sort=False))
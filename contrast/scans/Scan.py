@@ -1,25 +1,143 @@
 import time
 import datetime
 import numpy as np
-from ..environment import macro, env
-from ..recorders import active_recorders, RecorderHeader, RecorderFooter
+from ..environment import macro, env, MacroSyntaxError
+from ..recorders import (active_recorders, RecorderHeader, RecorderFooter,
+                         RecorderProfile)
+from ..recorders.Recorder import bus
 from ..detectors import Detector, TriggeredDetector, TriggerSource
+from ..motors import Motor
 from contrast.detectors.PandaBox import PandaBox
-from ..utils import SpecTable
+from ..utils import SpecTable, wait_all_done
+from .. import utils
+from .Profiling import ScanProfiler, TimingModel
 from collections import OrderedDict
+import threading
 import sys
 
 
+class ReadoutThread(threading.Thread):
+    """
+    Helper thread which reads out one point of a pipelined scan, and
+    which re-raises any exception from the readout when joined.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ReadoutThread, self).__init__(*args, **kwargs)
+        self.error = None
+
+    def run(self):
+        try:
+            super(ReadoutThread, self).run()
+        except BaseException as e:
+            self.error = e
+
+    def join(self, *args, **kwargs):
+        super(ReadoutThread, self).join(*args, **kwargs)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class PositionPlan(object):
+    """
+    The positions of a scan, held as an (N_points x N_motors) array
+    with one column per motor. Iterating over a plan yields the rows.
+
+    Grid scans can also give the logical grid index of each point, which
+    is passed on to the recorders as ``grid_index``, so that maps can be
+    put together whatever order the points were visited in.
+    """
+    def __init__(self, names, positions, indices=None):
+        """
+        :param names: Motor names, in the order of the columns
+        :type names: list, tuple
+        :param positions: Array-like of shape (N_points, N_motors)
+        :param indices: Optional integer array-like of grid indices, of
+                        shape (N_points, N_grid_axes)
+        """
+        self.names = list(names)
+        self.positions = np.asarray(positions, dtype=float)
+        assert self.positions.ndim == 2
+        assert self.positions.shape[1] == len(self.names)
+        self.indices = None
+        if indices is not None:
+            self.indices = np.asarray(indices, dtype=int)
+            assert self.indices.shape[0] == self.positions.shape[0]
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def dicts(self):
+        """
+        Generator over the positions as dicts, in the format of
+        ``SoftwareScan._generate_positions``.
+        """
+        for row in self.positions:
+            yield dict(zip(self.names, row))
+
+
+class GeneratorPlan(object):
+    """
+    Adapter which gives the position dicts yielded by legacy
+    ``_generate_positions`` implementations the iteration interface of
+    ``PositionPlan``. The positions are consumed lazily, so interactive
+    and endless generators keep working.
+    """
+    def __init__(self, motors, generator):
+        self.names = [m.name for m in motors]
+        self.generator = generator
+        self.indices = None
+
+    def __iter__(self):
+        for pos in self.generator:
+            yield [pos[name] for name in self.names]
+
+
 class SoftwareScan(object):
     """
     Base class for the normal sardana-style software-controlled scan.
     Respects the availability and deadlines managed by env.scheduler,
     honours env.shapshot, and acts on all active detectors, trigger
     sources, and recorders.
+
+    Setting ``pipelined = True``, on the class or on an instance, makes
+    the scan start moving to the next position while the previous point
+    is being read out and passed to the recorders. Detectors which do
+    not have ``read_during_motion`` set are still read before the move.
+    The readout is always completed before the detectors are armed
+    again, so the order of the ``_before_move``, ``_before_arm`` etc.
+    hooks is unchanged, and the point is printed by the main thread
+    at that time.
+
+    Once the header has been sent, the recorders get a footer however
+    the scan ends. ``_after_scan`` is called after the footer, and also
+    when the scan is refused because of the motor limits or of busy
+    gadgets.
+
+    With ``skip_unchanged = True``, motors are only told to move when
+    their target differs from that of the previous point, which saves
+    the settling of the slow axes of grid scans.
+
+    Compression rules for the data files of the scan, which take
+    precedence over those of the recorders, can be set as
+    ``compression``, see ``Hdf5Recorder``.
+
+    Large arrays are passed to the recorders through shared memory if
+    ``shared_memory`` is set to a ``SharedRing``.
     """
 
     dict_print_length = 5
     str_print_length = 12
+    pipelined = False
+    skip_unchanged = False
+    validate_limits = True
+    max_violations = 10
+    compression = None
+    shared_memory = None
+    _clock = time  # anything with time() and sleep(), see Simulation
 
     def __init__(self, exposuretime):
         """
@@ -37,8 +155,12 @@ class SoftwareScan(object):
         self.print_progress = True
         env.nextScanID += 1
         self.flyscan = False
+        self.timing = None
+        self._point_index = 0
 
     def output(self, i, dct):
+        # grid indices are only for the recorders
+        dct.pop('grid_index', None)
         # ignore dicts that are too long
         for k, v in dct.items():
             if type(v) == dict and len(v) > self.dict_print_length:
@@ -53,18 +175,24 @@ class SoftwareScan(object):
             print('-' * len(header.split('\n')[-1]))
         print(self.table.fill_line(dct))
         if self.n_positions and self.print_progress:
+            if self.timing is not None:
+                seconds = self.timing.remaining(i, self.n_positions)
+            else:
+                seconds = (self.n_positions - i) * dct['dt'] / (i + 1)
             timeleft = str(datetime.timedelta(
-                seconds=(
-                    self.n_positions - i) * dct['dt'] / (i + 1))).split('.')[0]
+                seconds=seconds)).split('.')[0]
             print('Time left: %s\r' % timeleft, end='')
 
     def _calc_time_needed(self):
         """
         Estimates the time needed for performing the next acquisition.
         This can be done based on the input parameters, or on the timing
-        of previous points.
+        of previous points. By default the ``TimingModel`` of the scan
+        is used.
         """
-        return self.exposuretime * 5 + 5
+        if self.timing is None:
+            return self.exposuretime * 5 + 5
+        return self.timing.point_time(self._point_index)
 
     def _before_scan(self):
         """
@@ -143,14 +271,25 @@ class SoftwareScan(object):
         """
         self._before_scan()
         print('\nScan #%d starting at %s' % (self.scannr, time.asctime()))
-        positions = self._generate_positions()
+        positions = self._plan()
+        lookup = {m.name: m for m in self.motors}
+        movers = [lookup[name] for name in positions.names]
+        # check the whole trajectory before anything happens
+        if self.validate_limits:
+            violations = self._limit_violations(positions)
+            if violations:
+                print('Scan #%d refused, %d positions are outside the '
+                      'motor limits:\n' % (self.scannr, len(violations)))
+                print(violations_table(violations[:self.max_violations]))
+                self._after_scan()
+                return
         # find and prepare the detectors
-        det_group = Detector.get_active()
-        trg_group = TriggerSource.get_active()
+        det_group, trg_group = self._detector_groups()
         group = det_group + trg_group
         if group.busy():
             print('These gadgets are busy: %s'
                   % (', '.join([d.name for d in group if d.busy()])))
+            self._after_scan()
             return
         if not self.flyscan:
             for d in group:
@@ -158,97 +297,304 @@ class SoftwareScan(object):
                     d.hw_trig_n = 1
         group.prepare(self.exposuretime, self.scannr, self.n_positions,
                       trials=10)
-        t0 = time.time()
+        reference = ScanProfiler.last
+        self.profiler = ScanProfiler(self.scannr, self.exposuretime,
+                                     self._clock)
+        self.timing = self._timing_model(positions, group, self.profiler,
+                                         reference)
+        t0 = self._clock.time()
 
         # take a pre scan snapshot
-        if env.snapshot.pre_scan:
-            snap = env.snapshot.capture()
-        else:
-            snap = {}
+        snap = self._snapshot('pre_scan')
 
         # send a header to the recorders
-        for r in active_recorders():
-            r.queue.put(RecorderHeader(scannr=self.scannr,
-                                       status='started',
-                                       path=env.paths.directory,
-                                       snapshot=snap,
-                                       description=self._command))
+        self._dispatch(RecorderHeader(scannr=self.scannr,
+                                      status='started',
+                                      path=env.paths.directory,
+                                      snapshot=snap,
+                                      description=self._command,
+                                      n_positions=self.n_positions,
+                                      shapes=self._shapes(positions),
+                                      compression=self.compression,
+                                      grid=self._grid(positions)))
+        readout = None
+        previous = None
+        status = 'interrupted'
         try:
             for i, pos in enumerate(positions):
+                prof = self.profiler.new_point()
+                self._point_index = i
                 # move motors
                 self._before_move()
-                for m in self.motors:
-                    m.move(pos[m.name])
-                while True in [m.busy() for m in self.motors]:
-                    time.sleep(.05)
+                prof.toc('before_move')
+                for j, (m, p) in enumerate(zip(movers, pos)):
+                    if (self.skip_unchanged and previous is not None
+                            and p == previous[j]):
+                        continue
+                    m.move(p)
+                previous = pos
+                wait_all_done(self.motors)
+                prof.toc('move')
+                # the previous point has to be read out before re-arming
+                if readout is not None:
+                    readout, done = None, readout
+                    done.join()
+                    prof.toc('wait_readout')
+                    # printed here, output() isn't made for threads
+                    self._show_point(*done.point)
+                    prof.tic()
+                else:
+                    prof.toc('wait_readout')
                 # arm detectors
                 self._before_arm()
+                prof.toc('before_arm')
                 group.arm()
+                prof.toc('arm')
                 # start detectors
                 self._before_start()
+                prof.toc('before_start')
                 group.start(trials=10)
-                while det_group.busy():
+                prof.toc('start')
+                while not det_group.wait_done(timeout=.05):
                     self._while_acquiring()
-                    time.sleep(.05)
-                # read detectors and motors
-                dt = time.time() - t0
+                prof.toc('acquire')
+                # read motors, and the detectors that can't be read later
+                dt = self._clock.time() - t0
                 dct = OrderedDict()
                 for m in self.motors:
                     dct[m.name] = m.position()
-                for d in det_group:
-                    dct[d.name] = d.read()
-                dct['dt'] = dt
-                # pass data to recorders
-                for r in active_recorders():
-                    r.queue.put(dct)
-                # print spec-style info
-                self.output(i, dct.copy())
-            print('\nScan #%d ending at %s' % (self.scannr, time.asctime()))
-
-            # take a post scan snapshot
-            if env.snapshot.post_scan:
-                snap = env.snapshot.capture()
-            else:
-                snap = {}
-            # tell the recorders that the scan is over
-            for r in active_recorders():
-                r.queue.put(RecorderFooter(scannr=self.scannr,
-                                           status='finished',
-                                           path=env.paths.directory,
-                                           snapshot=snap,
-                                           description=self._command))
+                    prof.toc('read', m.name)
+                if positions.indices is not None:
+                    dct['grid_index'] = positions.indices[i].reshape((1, -1))
+                early = {}
+                if self.pipelined:
+                    for d in det_group:
+                        if not d.read_during_motion:
+                            early[d.name] = d.read()
+                            prof.toc('read', d.name)
+                    readout = ReadoutThread(
+                        target=self._read_point,
+                        args=(i, dct, det_group, dt, early, prof))
+                    readout.point = (i, dct, prof)
+                    readout.start()
+                else:
+                    self._read_point(i, dct, det_group, dt, early, prof)
+                    self._show_point(i, dct, prof)
+            if readout is not None:
+                readout, done = None, readout
+                done.join()
+                self._show_point(*done.point)
+            status = 'finished'
 
         except KeyboardInterrupt:
             group.stop()
-            print('\nScan #%d cancelled at %s' % (self.scannr, time.asctime()))
 
+        finally:
+            # the recorders get a footer whatever went wrong
+            self._end_scan(readout, status)
+
+    def _end_scan(self, readout, status):
+        """
+        Waits for the readout of the last point if there is one, sends
+        the footer to the recorders, and does the user-defined cleanup.
+        Errors of the readout are only printed, so that they don't
+        stop the footer or hide the error which ended the scan.
+        """
+        if readout is not None:
+            try:
+                readout.join()
+                self._show_point(*readout.point)
+            except Exception as e:
+                print('\nReadout of point %d failed: %s'
+                      % (readout.point[0], e))
+        if status == 'finished':
+            print('\nScan #%d ending at %s' % (self.scannr, time.asctime()))
+        else:
+            print('\nScan #%d cancelled at %s'
+                  % (self.scannr, time.asctime()))
+
+        try:
             # take a post scan snapshot
-            if env.snapshot.post_scan:
-                snap = env.snapshot.capture()
-            else:
-                snap = {}
-            # tell the recorders that the scan was interrupted
-            for r in active_recorders():
-                r.queue.put(RecorderFooter(scannr=self.scannr,
-                                           status='interrupted',
-                                           path=env.paths.directory,
-                                           snapshot=snap,
-                                           description=self._command))
-        except:
+            snap = self._snapshot('post_scan')
+            # tell the recorders how the scan ended
+            self._dispatch(RecorderFooter(scannr=self.scannr,
+                                          status=status,
+                                          path=env.paths.directory,
+                                          snapshot=snap,
+                                          description=self._command))
+
+            # hand everything over to the recorders before returning
+            bus.join()
+        finally:
+            # do any user-defined cleanup actions
             self._after_scan()
-            raise
 
-        # do any user-defined cleanup actions
-        self._after_scan()
+    def _read_point(self, i, dct, det_group, dt, early, prof):
+        """
+        Reads the detectors and passes the data on to the recorders for
+        point i. Detector values which have already been read are passed
+        in the dict early. Runs in a separate thread for pipelined
+        scans.
+        """
+        prof.tic()
+        for d in det_group:
+            if d.name in early:
+                dct[d.name] = early[d.name]
+            else:
+                dct[d.name] = d.read()
+                prof.toc('read', d.name)
+        dct['dt'] = dt
+        # pass data to recorders
+        self._dispatch(dct)
+        prof.toc('enqueue')
+
+    def _show_point(self, i, dct, prof):
+        """
+        Prints the progress for point i once it has been read out, and
+        passes the timing of the point on to the recorders. Runs in the
+        main thread, also for pipelined scans.
+        """
+        prof.tic()
+        # print spec-style info
+        self.output(i, dct.copy())
+        prof.toc('output')
+        # pass the timing of this point on too
+        self._dispatch(RecorderProfile(prof))
+
+    def _limit_violations(self, positions):
+        """
+        Checks all positions of a ``PositionPlan`` against the motor
+        limits in one go, while other plans are only checked as the
+        motors move.
+
+        :returns: List of (point, motor name, position, limits) tuples,
+                  where limits is None if only the physical motors of a
+                  pseudo motor are out of range.
+        """
+        if not isinstance(positions, PositionPlan):
+            return []
+        lookup = {m.name: m for m in self.motors}
+        violations = []
+        for j, name in enumerate(positions.names):
+            m = lookup[name]
+            column = positions.positions[:, j]
+            ok = m.check_limits(column)
+            if ok.all():
+                continue
+            own = Motor.check_limits(m, column)
+            for i in np.flatnonzero(~ok):
+                limits = None if own[i] else one_sided_limits(m)
+                violations.append((i, name, column[i], limits))
+        violations.sort(key=lambda v: v[0])
+        return violations
+
+    def _shapes(self, positions):
+        """
+        The (shape, dtype) of one point's value for the data keys which
+        are known before the scan starts, so that recorders can set up
+        their datasets in advance.
+        """
+        shapes = {m.name: ((), 'float64') for m in self.motors}
+        shapes['dt'] = ((), 'float64')
+        if positions.indices is not None:
+            shapes['grid_index'] = ((1, positions.indices.shape[1]),
+                                    str(positions.indices.dtype))
+        return shapes
+
+    def _grid(self, positions):
+        """
+        The grid geometry of the scan for the header, see
+        ``RecorderHeader``, or None if the points aren't on a grid with
+        one motor per axis.
+        """
+        indices = positions.indices
+        if indices is None or indices.shape[1] != len(positions.names):
+            return None
+        pos = positions.positions
+        first, last = indices.argmin(axis=0), indices.argmax(axis=0)
+        return {'shape': [int(n) + 1 for n in indices.max(axis=0)],
+                'axes': list(positions.names),
+                'extent': [[float(pos[first[j], j]), float(pos[last[j], j])]
+                           for j in range(len(positions.names))],
+                'lines': False}
+
+    def _detector_groups(self):
+        """
+        Returns the ``DetectorGroup`` objects of active detectors and
+        of active trigger sources to use in the scan.
+        """
+        return Detector.get_active(), TriggerSource.get_active()
+
+    def _dispatch(self, msg):
+        """
+        Passes a header, data dict, profile or footer on to all active
+        recorders, through the ``RecorderBus`` so that it returns at once.
+        Profiles only go to the recorders which ask for them.
+        """
+        recorders = active_recorders()
+        if isinstance(msg, RecorderProfile):
+            recorders = [r for r in recorders if r.profiles]
+            if not recorders:
+                return
+        bus.publish(msg, recorders, self.shared_memory)
+
+    def _snapshot(self, when):
+        """
+        Captures the environment snapshot if it is configured for
+        ``when``, which is 'pre_scan' or 'post_scan'.
+        """
+        if getattr(env.snapshot, when):
+            return env.snapshot.capture()
+        return {}
+
+    def _timing_model(self, positions, group, profiler=None,
+                      reference=None):
+        """
+        Sets up a ``TimingModel`` for the positions, which learns from
+        the points measured by profiler, and from the reference
+        ``ScanProfiler`` until then.
+        """
+        lookup = {m.name: m for m in self.motors}
+        movers = [lookup[name] for name in positions.names]
+        gadgets = [m.name for m in self.motors] + [g.name for g in group]
+        timing = TimingModel(movers, self.exposuretime, profiler,
+                             reference, gadgets)
+        if isinstance(positions, PositionPlan):
+            timing.plan(positions)
+        return timing
+
+    def _plan(self):
+        """
+        Returns the positions to visit, from ``_generate_plan`` or from
+        ``_generate_positions``, whichever is overridden furthest down
+        the class hierarchy.
+        """
+        for cls in type(self).__mro__:
+            if cls is SoftwareScan:
+                break
+            if '_generate_plan' in vars(cls):
+                return self._generate_plan()
+            if '_generate_positions' in vars(cls):
+                return GeneratorPlan(self.motors, self._generate_positions())
+        raise NotImplementedError
+
+    def _generate_plan(self):
+        """
+        *Override this method,* or ``_generate_positions``. Returns a
+        ``PositionPlan`` holding all positions of the scan. This is the
+        faster option, and lets the whole trajectory be treated at
+        once.
+        """
+        raise NotImplementedError
 
     def _generate_positions(self):
         """
-        *Override this method.* Function or generator which returns or
-        yields an iterable of dicts, ::
+        *Override this method,* or ``_generate_plan``. Function or
+        generator which returns or yields an iterable of dicts, ::
 
             {motorA.name: posA, motorB.name: posB, ...}
         """
-        raise NotImplementedError
+        return self._generate_plan().dicts()
 
 
 @macro
@@ -265,10 +611,9 @@ class LoopScan(SoftwareScan):
         self.n_positions = intervals + 1
         self.motors = []
 
-    def _generate_positions(self):
-        # dummy positions with a non existent motor
-        for i in range(self.intervals + 1):
-            yield {'fake': i}
+    def _generate_plan(self):
+        # no motors, so just the right number of empty positions
+        return PositionPlan([], np.empty((self.intervals + 1, 0)))
 
 
 @macro
@@ -312,8 +657,7 @@ class Ct(object):
         group.arm()
         group.start()
         try:
-            while group.busy():
-                time.sleep(.01)
+            group.wait_done()
         except KeyboardInterrupt:
             group.stop()
         # read detectors and motors
@@ -324,3 +668,95 @@ class Ct(object):
         for key, val in dct.items():
             print(key, ':', val)
         self._after_ct()
+
+
+def one_sided_limits(motor):
+    """
+    The user limits of a motor, where a missing dial limit stays None
+    instead of hiding the other one.
+    """
+    lims = [None if l is None else l * motor._scaling + motor._offset
+            for l in motor.dial_limits]
+    return tuple(lims[::-1]) if motor._scaling < 0 else tuple(lims)
+
+
+def violations_table(violations):
+    """
+    Formats a list of (point, motor name, position, limits) tuples of
+    limit violations as a table.
+    """
+    titles = ['point', 'motor', 'position', 'limits']
+    table = []
+    for i, name, pos, limits in violations:
+        if limits is None:
+            limits = 'physical motors'
+        else:
+            limits = '(%s, %s)' % tuple('-' if l is None else '%g' % l
+                                        for l in limits)
+        table.append([str(i), name, '%g' % pos, limits])
+    return utils.list_to_table(lst=table, titles=titles, sort=False)
+
+
+def scan_from_macro(name, *args, **kwargs):
+    """
+    Constructs a scan from the name of its macro and its arguments,
+    without using up a scan number, for scans that are not going to be
+    run for real.
+    """
+    cls = env.registeredMacros.get(str(name).lower())
+    if not (isinstance(cls, type) and issubclass(cls, SoftwareScan)):
+        raise MacroSyntaxError
+    # the scan constructor takes the next scan number, give it back
+    scannr = env.nextScanID
+    try:
+        scan = cls(*args, **kwargs)
+    finally:
+        env.nextScanID = scannr
+    scan._command = ' '.join(
+        [str(name)] + [getattr(a, 'name', str(a)) for a in args])
+    return scan
+
+
+@macro
+class ScanEstimate(object):
+    """
+    Predict the duration of a scan without running it, from the motion
+    models of the motors and the overheads measured in the last scan. ::
+
+        scanestimate <scan macro> <scan arguments>
+
+    For example, ::
+
+        scanestimate ascan samx 0 1 100 .1
+    """
+    def __init__(self, name, *args, **kwargs):
+        self.scan = scan_from_macro(name, *args, **kwargs)
+
+    def run(self):
+        scan = self.scan
+        positions = scan._plan()
+        group = Detector.get_active() + TriggerSource.get_active()
+        timing = scan._timing_model(positions, group,
+                                    reference=ScanProfiler.last)
+        if isinstance(positions, PositionPlan):
+            n = len(positions)
+        elif scan.n_positions:
+            n = int(scan.n_positions)
+        else:
+            print('The number of points of this scan is not known.')
+            return
+        if timing.move_times is not None:
+            moving = timing.move_times.sum()
+        else:
+            moving = n * timing.mean_move()
+        dct = OrderedDict()
+        dct['motion'] = moving
+        dct['exposure'] = n * timing.exposuretime
+        dct['overhead'] = n * timing.overhead()
+        total = timing.remaining(-1, n)
+        dct['total'] = total
+        for key, val in dct.items():
+            dct[key] = str(datetime.timedelta(seconds=val)).split('.')[0]
+        print('\nEstimate for %s, %d points' % (scan._command, n))
+        print(utils.dict_to_table(dct, titles=('', 'time'), sort=False))
+        return total
@@ -0,0 +1,240 @@
+"""
+Provides dry runs of scans, where the motors and detectors are replaced
+by dummy twins which run on a virtual clock. This gives the positions,
+limit violations, duration and data volume of a scan without touching
+the hardware or waiting for it.
+"""
+
+from ..environment import macro, env
+from ..Gadget import Gadget
+from ..motors import DummyMotor
+from ..detectors import (DummyDetector, Dummy1dDetector, DummyDictDetector,
+                         DetectorGroup)
+from ..recorders import active_recorders
+from .. import utils
+from .Scan import (PositionPlan, scan_from_macro, violations_table,
+                   one_sided_limits)
+from .Profiling import ScanProfiler
+from array import array
+from collections import OrderedDict
+import contextlib
+import datetime
+import numpy as np
+import pickle
+import io
+import weakref
+
+
+class VirtualClock(object):
+    """
+    Stands in for the ``time`` module, but only advances on sleep().
+    """
+    def __init__(self, start=0.):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, dt):
+        self.now += max(dt, 0.)
+
+
+class TwinMotor(DummyMotor):
+    """
+    Dummy copy of a motor, with the same name, position, scaling,
+    offset, limits and velocity. Moves outside the limits are reported
+    to the ``Simulation``, unless the whole trajectory has been checked
+    against the real motors already.
+    """
+    def __init__(self, motor, simulation):
+        """
+        :param motor: The motor to copy
+        :type motor: Motor
+        :param simulation: The simulation which runs the twin
+        :type simulation: Simulation
+        """
+        try:
+            profile = motor._motion_profile()
+        except Exception:
+            profile = None
+        velocity = np.inf if profile is None else profile[0]
+        super(TwinMotor, self).__init__(
+            name=motor.name, userlevel=motor.userlevel, velocity=velocity,
+            dial_position=motor.dial_position, scaling=motor._scaling,
+            offset=motor._offset, dial_limits=motor.dial_limits,
+            user_format=motor._uformat, dial_format=motor._dformat)
+        self.modelled = profile is not None
+        self._clock = simulation.clock
+        self._simulation = simulation
+
+    def move(self, pos):
+        ret = super(TwinMotor, self).move(pos)
+        if ret == -1:
+            self._simulation._violation(self, pos)
+        return ret
+
+
+class Simulation(object):
+    """
+    Runs a ``SoftwareScan`` against dummy twins of its motors and of the
+    active detectors, using the ordinary run loop on a ``VirtualClock``.
+    Readout latencies default to those measured in the last scan. The
+    user hooks, the scheduler and pipelining are left out, so the
+    scan should not override ``run()`` or reach other gadgets. Plans
+    which are known in advance are checked against the limits of the
+    real motors, so that pseudo motors also check their physical
+    motors. ::
+
+        sim = Simulation(Mesh(samx, 0, 1, 10, samy, 0, 1, 10, .1))
+        sim.run()
+        sim.duration, sim.violations, sim.volume
+    """
+    def __init__(self, scan, latencies=None):
+        """
+        :param scan: The scan to simulate, which is modified in place
+        :type scan: SoftwareScan
+        :param latencies: Readout time per detector name, overrides
+                          the measured ones
+        :type latencies: dict
+        """
+        self.scan = scan
+        self.latencies = latencies or {}
+        self.clock = VirtualClock()
+        self.points = None
+        self.violations = []
+        self.duration = None
+        self.volume = 0
+        self.unmodelled = []
+        self._checked = False
+
+    def _violation(self, motor, pos):
+        if self._checked:
+            return
+        self.violations.append(
+            (self.scan._point_index, motor.name, pos,
+             one_sided_limits(motor)))
+
+    def _dispatch(self, msg):
+        # only the data counts, pickled like the RecorderBus does
+        if type(msg) is OrderedDict:
+            self._positions.extend(msg[m.name] for m in self.scan.motors)
+            self.volume += len(pickle.dumps(msg, protocol=-1))
+
+    def _twin_detector(self, detector, reference):
+        # dummies which only produce data in memory can be copied as such
+        cls = type(detector)
+        if cls not in (DummyDetector, Dummy1dDetector, DummyDictDetector):
+            cls = DummyDetector
+        twin = cls(name=detector.name)
+        twin.read_during_motion = detector.read_during_motion
+        twin._clock = self.clock
+        if detector.name in self.latencies:
+            twin.latency = self.latencies[detector.name]
+        elif reference is not None:
+            twin.latency = reference.mean('read', detector.name) or 0.
+        return twin
+
+    def run(self):
+        """
+        Runs the simulation and fills in ``points``, ``violations``,
+        ``duration`` and ``volume``.
+        """
+        scan = self.scan
+        reference = ScanProfiler.last
+        # the real motors know their limits best, pseudo motors included
+        plan = scan._plan()
+        self.violations = scan._limit_violations(plan)
+        self._checked = isinstance(plan, PositionPlan)
+        motors = [TwinMotor(m, self) for m in scan.motors]
+        self.unmodelled = [m.name for m in motors if not m.modelled]
+        det_group = DetectorGroup(*[self._twin_detector(d, reference)
+                                    for d in scan._detector_groups()[0]])
+        det_group.concurrent = False
+
+        # set up the scan to only see the twins
+        scan.motors = motors
+        scan._plan = lambda: plan
+        scan._clock = self.clock
+        scan.pipelined = False
+        scan.validate_limits = False
+        scan._detector_groups = lambda: (det_group, DetectorGroup())
+        scan._dispatch = self._dispatch
+        scan._snapshot = lambda when: (
+            {m.name: m.position() for m in motors}
+            if getattr(env.snapshot, when) else {})
+        scan.output = lambda i, dct: None
+        for hook in ('_before_scan', '_after_scan', '_before_move',
+                     '_before_arm', '_before_start', '_while_acquiring'):
+            setattr(scan, hook, lambda: None)
+
+        self._positions = array('d')
+        self.volume = 0
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                scan.run()
+        finally:
+            ScanProfiler.last = reference
+            # the twins must not shadow the real gadgets by name
+            for g in motors + list(det_group):
+                Gadget._base_class_instances.discard(weakref.ref(g))
+        self.duration = self.clock.time()
+        names = [m.name for m in motors]
+        self.points = PositionPlan(
+            names, np.frombuffer(self._positions, dtype=float).reshape(
+                (-1, len(names))))
+        del self._positions
+        return self
+
+
+def format_bytes(n):
+    """
+    Formats a number of bytes for humans.
+    """
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if n < 1000:
+            break
+        n /= 1000.
+    return '%.1f %s' % (n, unit) if unit != 'B' else '%d B' % n
+
+
+@macro
+class Simulate(object):
+    """
+    Dry-run a scan on dummy copies of its motors and of the active
+    detectors, without moving or waiting for anything, and report its
+    positions, limit violations, duration and data volume. ::
+
+        simulate <scan macro> <scan arguments>
+
+    For example, ::
+
+        simulate mesh samx 0 1 100 samy 0 1 100 .1
+
+    The ``Simulation`` is returned, and its ``points`` holds all
+    positions of the scan.
+    """
+    max_violations = 10
+
+    def __init__(self, name, *args, **kwargs):
+        self.scan = scan_from_macro(name, *args, **kwargs)
+
+    def run(self):
+        command = self.scan._command
+        sim = Simulation(self.scan).run()
+        n_recorders = len(list(active_recorders()))
+        print('\nSimulated %s' % command)
+        dct = OrderedDict()
+        dct['points'] = str(len(sim.points))
+        dct['duration'] = str(
+            datetime.timedelta(seconds=sim.duration)).split('.')[0]
+        dct['data per recorder'] = format_bytes(sim.volume)
+        dct['active recorders'] = str(n_recorders)
+        dct['limit violations'] = str(len(sim.violations))
+        print(utils.dict_to_table(dct, titles=('', ''), sort=False))
+        if sim.unmodelled:
+            print('\nMotion of %s not known, these moved instantly.'
+                  % ', '.join(sim.unmodelled))
+        if sim.violations:
+            print('')
+            print(violations_table(sim.violations[:self.max_violations]))
+        return sim
@@ -1,15 +1,8 @@
-from .Scan import SoftwareScan
-from .AScan import DScan
-from ..environment import macro, MacroSyntaxError
-from ..motors import all_are_motors
-import numpy as np
-import time
-
-
-from .Scan import SoftwareScan
+from .Scan import SoftwareScan, PositionPlan
 from .AScan import DScan, AScan
 from ..environment import macro, MacroSyntaxError
 from ..motors import all_are_motors
+from .Trajectory import optimize_path
 import numpy as np
 import time
 
@@ -35,13 +28,14 @@ class SpiralScan(DScan):
         except:
             raise MacroSyntaxError
 
-    def _generate_positions(self):
+    def _generate_plan(self):
         starting = [m.position() for m in self.motors]
-        for t in range(self.n_positions):
-            A = self.stepsize * np.sqrt(t/np.pi)
-            B = np.sqrt(4*np.pi*t)
-            yield {self.motors[0].name: starting[0] + A * np.cos(B),
-                   self.motors[1].name: starting[1] + A * np.sin(B)}
+        t = np.arange(self.n_positions)
+        A = self.stepsize * np.sqrt(t/np.pi)
+        B = np.sqrt(4*np.pi*t)
+        return PositionPlan([m.name for m in self.motors],
+                            np.column_stack([starting[0] + A * np.cos(B),
+                                             starting[1] + A * np.sin(B)]))
 
 @macro
 class FermatScan(AScan):
@@ -53,8 +47,9 @@ class FermatScan(AScan):
         fermatscan <motor1> <start> <stop> <motor2> <start> <stop> <stepsize> <exp_time>
 
     optional keyword arguments:
-        optimize: boolean ... will try to solve the traveling salesman problem
-                              WARNING: can be slow for large scans!
+        optimize: bool or float ... finds a short path through the points,
+                                    a number gives the time budget in
+                                    seconds (1 s for True)
     """
 
     def __init__(self, m1, l1_l, l1_u, m2, l2_l, l2_u, stepsize, exptime, **kwargs):
@@ -63,7 +58,7 @@ class FermatScan(AScan):
             self.motors = [m1, m2]
             self.limits = [[l1_l, l1_u],[l2_l, l2_u]]
             self.stepsize = float(stepsize)
-            self.optimize = False
+            self.optimize = kwargs.get('optimize', False)
             self.calc_positions()
             self.n_positions = int(len(self.pos_12))
             assert all_are_motors(self.motors)
@@ -101,47 +96,14 @@ class FermatScan(AScan):
             pos_12.append([p1,p2])
         pos_12 = np.array(pos_12)
         # finding a short(er) scan path
+        # sort on the first motor axis
+        best_path = np.argsort(pos_12[:,0])
         if self.optimize:
-            # basically... solving the TSP problem
-            best_path = self.two_opt(pos_12)
-            self.pos_12 = pos_12[best_path]
-        else:
-            # sort on the first motor axis
-            best_path = np.argsort(pos_12[:,0])
-            self.pos_12 = pos_12[best_path]
+            # basically... solving the TSP problem, from the same start
+            best_path = optimize_path(pos_12, start=best_path[0],
+                                      time_budget=float(self.optimize))
+        self.pos_12 = pos_12[best_path]
 
-    def _generate_positions(self):
+    def _generate_plan(self):
         #generate the positions in the improved order
-        for i, pos in enumerate(self.pos_12):
-            yield {self.motors[0].name: pos[0],
-                   self.motors[1].name: pos[1]}
-
-    def two_opt(self, cities, improvement_threshold=0.5, max_iter=4):
-        # 2-opt Algorithm adapted from https://en.wikipedia.org/wiki/2-opt
-        # from https://stackoverflow.com/questions/25585401/travelling-salesman-in-scipy
-
-        # Calculate the euclidian distance in n-space of the route r 
-        # traversing cities c, ending at the path start.
-        def path_distance(r,c): 
-            return np.sum([np.linalg.norm(c[r[p]]-c[r[p-1]]) for p in range(len(r))])
-
-        # Reverse the order of all elements from element i to element k in array r.
-        def two_opt_swap(r,i,k): 
-            return np.concatenate((r[0:i],r[k:-len(r)+i-1:-1],r[k+1:len(r)]))
-
-        route = np.arange(cities.shape[0])
-        improvement_factor = 1 
-        iterations = 0
-        best_distance = path_distance(route,cities) 
-        while improvement_factor > improvement_threshold and iterations<max_iter: 
-            distance_to_beat = best_distance 
-            for swap_first in range(1,len(route)-2): 
-                for swap_last in range(swap_first+1,len(route)): 
-                    new_route = two_opt_swap(route,swap_first,swap_last)
-                    new_distance = path_distance(new_route,cities) 
-                    if new_distance < best_distance: 
-                        route = new_route
-                        best_distance = new_distance 
-            improvement_factor = 1 - best_distance/distance_to_beat 
-            iterations += 1
-        return route
+        return PositionPlan([m.name for m in self.motors], self.pos_12)
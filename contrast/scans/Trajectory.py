@@ -0,0 +1,386 @@
+"""
+Provides path optimization for scans which visit an unordered set of
+positions, such as Fermat spirals or position lists. A short path is
+built from nearest neighbours and then improved with 2-opt and Or-opt
+moves until no move helps or the time budget is used up.
+"""
+
+import itertools
+import time
+import numpy as np
+
+
+class GridIndex(object):
+    """
+    Spatial index which sorts N-dimensional points into buckets on a
+    regular grid, for finding near neighbours without comparing all
+    pairs of points.
+    """
+    def __init__(self, points, per_cell=3.):
+        """
+        :param points: Array of shape (N_points, N_dims)
+        :param per_cell: Average number of points per occupied region
+                         to aim for when choosing the cell size
+        :type per_cell: float
+        """
+        self.points = np.asarray(points, dtype=float)
+        n, ndim = self.points.shape
+        self.lower = self.points.min(axis=0)
+        span = self.points.max(axis=0) - self.lower
+        extended = span[span > 0]
+        if len(extended):
+            volume = np.prod(extended) * per_cell / n
+            self.cell = volume ** (1. / len(extended))
+        else:
+            self.cell = 1.
+        self.keys = np.floor((self.points - self.lower)
+                             / self.cell).astype(int)
+        self.shape = self.keys.max(axis=0) + 1
+        self.buckets = {}
+        for i, key in enumerate(map(tuple, self.keys)):
+            self.buckets.setdefault(key, []).append(i)
+        self.buckets = {k: np.array(v) for k, v in self.buckets.items()}
+
+    def _block(self, key, r):
+        """
+        Indices of all points in the cells within r cells of key.
+        """
+        ranges = [range(max(k - r, 0), min(k + r, s - 1) + 1)
+                  for k, s in zip(key, self.shape)]
+        found = [self.buckets[c] for c in itertools.product(*ranges)
+                 if c in self.buckets]
+        return np.concatenate(found) if found else np.zeros(0, dtype=int)
+
+    def _ring(self, key, r):
+        """
+        The cells exactly r cells away from key, in the grid.
+        """
+        ndim = len(key)
+        for axis in range(ndim):
+            for side in (key[axis] - r, key[axis] + r):
+                if side < 0 or side >= self.shape[axis] or (r == 0
+                                                            and side > key[0]):
+                    continue
+                # axes before this one stay inside the ring, so that
+                # each cell comes up once
+                ranges = [range(max(key[a] - r + (a < axis), 0),
+                                min(key[a] + r - (a < axis),
+                                    self.shape[a] - 1) + 1)
+                          for a in range(ndim)]
+                ranges[axis] = (side,)
+                for cell in itertools.product(*ranges):
+                    yield cell
+                if r == 0:
+                    return
+
+    def nearest(self, i, excluded):
+        """
+        Returns the index of the nearest point to point i which isn't
+        excluded, or None if there is none. The cells around point i
+        are searched in growing rings until no closer point can be left
+        outside them.
+
+        :param i: Index of the point
+        :param excluded: Boolean array, True for points to skip
+        """
+        key = tuple(self.keys[i])
+        best, best_dist = None, np.inf
+        for r in range(int(self.shape.max()) + 1):
+            if best is not None and best_dist <= (r - 1) * self.cell:
+                break
+            for cell in self._ring(key, r):
+                members = self.buckets.get(cell)
+                if members is None:
+                    continue
+                members = members[~excluded[members]]
+                if not len(members):
+                    continue
+                dist = np.linalg.norm(self.points[members] - self.points[i],
+                                      axis=1)
+                j = np.argmin(dist)
+                if dist[j] < best_dist:
+                    best, best_dist = members[j], dist[j]
+        return best
+
+    def snake_order(self, members=None):
+        """
+        Orders points along a snake path through the grid cells, a cheap
+        path when there is no time for a better one.
+
+        :param members: Indices of the points to order, defaults to all
+        :returns: The indices, in path order
+        """
+        if members is None:
+            members = np.arange(len(self.points))
+        members = np.asarray(members, dtype=int)
+        keys = self.keys[members]
+        snaked = keys.copy()
+        for k in range(1, keys.shape[1]):
+            line = np.ravel_multi_index(tuple(keys[:, :k].T), self.shape[:k])
+            odd = (line % 2 == 1)
+            snaked[odd, k] = self.shape[k] - 1 - keys[odd, k]
+        return members[np.lexsort(snaked.T[::-1])]
+
+    def neighbours(self, k, deadline=None):
+        """
+        Returns the indices of the k nearest neighbours of every point,
+        sorted by distance, as an (N_points, k) array, or None if the
+        deadline (a time.time() value) passes first.
+        """
+        n = len(self.points)
+        k = min(k, n - 1)
+        result = np.zeros((n, k), dtype=int)
+        for key, members in self.buckets.items():
+            if deadline is not None and time.time() > deadline:
+                return None
+            r = 1
+            while True:
+                block = self._block(key, r)
+                dist = np.linalg.norm(self.points[members, None, :]
+                                      - self.points[None, block, :], axis=-1)
+                # points outside the block are at least r cells away
+                if len(block) > k:
+                    dist[members[:, None] == block[None, :]] = np.inf
+                    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                    kth = np.take_along_axis(dist, nearest, axis=1).max()
+                    if kth <= r * self.cell or len(block) == n:
+                        break
+                elif len(block) == n:
+                    dist[members[:, None] == block[None, :]] = np.inf
+                    nearest = np.argsort(dist, axis=1)[:, :k]
+                    break
+                r += 1
+            order = np.argsort(np.take_along_axis(dist, nearest, axis=1),
+                               axis=1)
+            result[members] = block[np.take_along_axis(nearest, order, axis=1)]
+        return result
+
+
+def path_length(points, route):
+    """
+    Total length of the path through points in the order of route.
+    """
+    points = np.asarray(points, dtype=float)
+    return np.linalg.norm(np.diff(points[route], axis=0), axis=1).sum()
+
+
+def nearest_neighbour_path(points, neighbours, start=0, index=None,
+                           deadline=None):
+    """
+    Builds a path by always going to the nearest unvisited point. The
+    neighbour lists are tried first, and the grid cells around the
+    current point only when every listed neighbour has been visited.
+
+    :param points: Array of shape (N_points, N_dims)
+    :param neighbours: Neighbour lists, as from ``GridIndex.neighbours``
+    :param start: Index of the first point
+    :param index: The ``GridIndex`` of the points, if already built
+    :param deadline: time.time() after which the points left are
+                     visited in the snake order of the grid cells
+    :returns: The route, a permutation of the point indices
+    """
+    n = len(points)
+    if index is None:
+        index = GridIndex(points)
+    visited = np.zeros(n, dtype=bool)
+    route = np.zeros(n, dtype=int)
+    current = route[0] = start
+    visited[start] = True
+    for step in range(1, n):
+        if deadline is not None and time.time() > deadline:
+            route[step:] = index.snake_order(np.flatnonzero(~visited))
+            break
+        candidates = neighbours[current]
+        candidates = candidates[~visited[candidates]]
+        if len(candidates):
+            current = candidates[0]
+        else:
+            current = index.nearest(current, visited)
+        route[step] = current
+        visited[current] = True
+    return route
+
+
+class _Optimizer(object):
+    """
+    Improves an open path with 2-opt and Or-opt moves. The gains of the
+    moves between each point and its neighbours are evaluated for the
+    whole path at once, and the improving moves which don't touch the
+    same points are then applied, best first.
+    """
+    eps = 1e-12
+
+    def __init__(self, points, neighbours, route):
+        self.points = points
+        self.neighbours = neighbours
+        self.route = route.copy()
+        self.n = len(route)
+        self.pos = np.empty(self.n, dtype=int)
+        self.pos[self.route] = np.arange(self.n)
+
+    def dist(self, a, b):
+        return np.linalg.norm(self.points[a] - self.points[b], axis=-1)
+
+    def two_opt(self):
+        """
+        One round of 2-opt: replaces the edges (a, b) and (c, d) by
+        (a, c) and (b, d), reversing the path between b and c. Returns
+        the number of moves made.
+        """
+        n, route, pos = self.n, self.route, self.pos
+        i = np.arange(n - 1)
+        a, b = route[i], route[i + 1]
+        c = self.neighbours[a]
+        j = pos[c]
+        has_d = j < n - 1
+        d = route[np.minimum(j + 1, n - 1)]
+        delta = (self.dist(a[:, None], c) - self.dist(a, b)[:, None]
+                 + np.where(has_d, self.dist(b[:, None], d)
+                            - self.dist(c, d), 0.))
+        delta[j <= i[:, None] + 1] = np.inf
+        best = np.argmin(delta, axis=1)
+        gain = delta[i, best]
+        moves = 0
+        touched = np.zeros(n, dtype=bool)
+        for ii in np.flatnonzero(gain < -self.eps)[np.argsort(
+                gain[gain < -self.eps])]:
+            a_, c_ = a[ii], c[ii, best[ii]]
+            b_ = route[pos[a_] + 1] if pos[a_] < n - 1 else -1
+            d_ = route[pos[c_] + 1] if pos[c_] < n - 1 else -1
+            expected_d = d[ii, best[ii]] if has_d[ii, best[ii]] else -1
+            if b_ != b[ii] or d_ != expected_d:
+                continue  # an earlier move changed these edges
+            if pos[c_] <= pos[b_]:
+                continue
+            nodes = [a_, b_, c_] + ([d_] if d_ >= 0 else [])
+            if touched[nodes].any():
+                continue
+            first, last = pos[b_], pos[c_]
+            route[first:last + 1] = route[first:last + 1][::-1]
+            pos[route[first:last + 1]] = np.arange(first, last + 1)
+            touched[nodes] = True
+            moves += 1
+        return moves
+
+    def or_opt(self, length):
+        """
+        One round of Or-opt: moves segments of the given length, in
+        either direction, next to a neighbour of one of their ends.
+        Returns the number of moves made.
+        """
+        n, route, pos = self.n, self.route, self.pos
+        if n < length + 2:
+            return 0
+        i = np.arange(1, n - length + 1)
+        p, s0, s1 = route[i - 1], route[i], route[i + length - 1]
+        has_q = i + length < n
+        q = route[np.minimum(i + length, n - 1)]
+        removed = self.dist(p, s0) + np.where(
+            has_q, self.dist(s1, q) - self.dist(p, q), 0.)
+        deltas, candidates = [], []
+        for end in (s0, s1):
+            c = self.neighbours[end]
+            j = pos[c]
+            has_d = j < n - 1
+            d = route[np.minimum(j + 1, n - 1)]
+            other = s1 if end is s0 else s0
+            # c, end ... other, d
+            added = (self.dist(c, end[:, None])
+                     + np.where(has_d, self.dist(other[:, None], d)
+                                - self.dist(c, d), 0.))
+            outside = (j < i[:, None] - 1) | (j > i[:, None] + length - 1)
+            deltas.append(np.where(outside, added - removed[:, None],
+                                   np.inf))
+            candidates.append(c)
+        delta = np.hstack(deltas)
+        c = np.hstack(candidates)
+        best = np.argmin(delta, axis=1)
+        gain = delta[np.arange(len(i)), best]
+        k = self.neighbours.shape[1]
+        moves = 0
+        touched = np.zeros(n, dtype=bool)
+        for ii in np.flatnonzero(gain < -self.eps)[np.argsort(
+                gain[gain < -self.eps])]:
+            seg_first, seg_last = s0[ii], s1[ii]
+            c_ = c[ii, best[ii]]
+            reverse = best[ii] >= k  # attached at the segment's last end
+            start = pos[seg_first]
+            if (start == 0 or pos[seg_last] != start + length - 1):
+                continue  # an earlier move changed this segment
+            if route[start - 1] != p[ii]:
+                continue
+            if pos[c_] >= start - 1 and pos[c_] <= start + length - 1:
+                continue
+            segment = route[start:start + length].copy()
+            d_ = route[pos[c_] + 1] if pos[c_] < n - 1 else -1
+            q_ = route[start + length] if start + length < n else -1
+            nodes = [p[ii], c_] + list(segment) + [x for x in (d_, q_)
+                                                  if x >= 0]
+            if touched[nodes].any():
+                continue
+            # check the gain again, the neighbourhood may have changed
+            before = (self.dist(p[ii], seg_first)
+                      + (self.dist(seg_last, q_) if q_ >= 0 else 0.)
+                      + (self.dist(c_, d_) if d_ >= 0 else 0.))
+            if reverse:
+                segment = segment[::-1]
+            after = ((self.dist(p[ii], q_) if q_ >= 0 else 0.)
+                     + self.dist(c_, segment[0])
+                     + (self.dist(segment[-1], d_) if d_ >= 0 else 0.))
+            if after - before > -self.eps:
+                continue
+            rest = np.concatenate([route[:start], route[start + length:]])
+            at = np.flatnonzero(rest == c_)[0] + 1
+            route[:] = np.concatenate([rest[:at], segment, rest[at:]])
+            pos[route] = np.arange(n)
+            touched[nodes] = True
+            moves += 1
+        return moves
+
+
+def optimize_path(points, start=0, time_budget=1., neighbours=8):
+    """
+    Finds a short open path through a set of points, starting at a
+    given point. A nearest-neighbour path is improved by 2-opt and
+    Or-opt moves between near neighbours, until no move helps or the
+    time budget is used up.
+
+    The budget covers building the path too. If it runs out before the
+    nearest-neighbour path is complete, the points left are visited in
+    a snake order through the cells of the ``GridIndex``, and the path
+    is returned as it is.
+
+    :param points: Array of shape (N_points, N_dims)
+    :param start: Index of the first point
+    :type start: int
+    :param time_budget: Maximum time to spend improving the path, in
+                        seconds
+    :type time_budget: float
+    :param neighbours: Number of near neighbours to consider per point
+    :type neighbours: int
+    :returns: The route, a permutation of the point indices
+    """
+    deadline = time.time() + time_budget
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 1:
+        points = points[:, None]
+    if len(points) < 3:
+        # nothing to optimize after the start
+        order = np.arange(len(points))
+        return np.concatenate([order[order == start], order[order != start]])
+    index = GridIndex(points)
+    nbrs = index.neighbours(neighbours, deadline)
+    if nbrs is None:
+        order = index.snake_order()
+        return np.concatenate([[start], order[order != start]])
+    route = nearest_neighbour_path(points, nbrs, start, index, deadline)
+    opt = _Optimizer(points, nbrs, route)
+    while time.time() < deadline:
+        moves = opt.two_opt()
+        for length in (1, 2, 3):
+            if time.time() >= deadline:
+                break
+            moves += opt.or_opt(length)
+        if not moves:
+            break
+    return opt.route
@@ -2,8 +2,10 @@
 Provides basic acquisition macros and base classes for custom macros.
 """
 
-from .Scan import SoftwareScan, Ct, LoopScan
+from .Scan import SoftwareScan, Ct, LoopScan, PositionPlan, ScanEstimate
 from .Mesh import Mesh, DMesh, MeshJMesh
 from .AScan import AScan, DScan
 from .Tweak import Tweak
 from .Spiral import SpiralScan, FermatScan
+from .Profiling import ScanProfiler, ScanProfile, TimingModel
+from .Simulation import Simulation, Simulate
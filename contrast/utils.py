@@ -3,6 +3,7 @@ from collections import OrderedDict
 from fnmatch import filter
 import h5py
 import numpy as np
+import time
 
 
 def list_to_table(lst, titles, margins=3, sort=True):
@@ -98,6 +99,73 @@ def str_to_args(line):
     return args_out, kwargs_out
 
 
+def move_duration(distance, velocity, acceleration=None):
+    """
+    Time needed to travel a distance with a trapezoidal velocity
+    profile, starting and ending at rest.
+
+    :param distance: Distance(s) to travel
+    :type distance: float or array
+    :param velocity: Maximum velocity
+    :param acceleration: Acceleration, None to reach velocity at once
+    :returns: Duration(s) in seconds
+    """
+    distance = np.abs(np.asarray(distance, dtype=float))
+    if not acceleration:
+        return distance / velocity
+    # the distance covered while accelerating and decelerating
+    ramps = velocity ** 2 / acceleration
+    return np.where(distance < ramps,
+                    2 * np.sqrt(distance / acceleration),
+                    distance / velocity + velocity / acceleration)
+
+
+def wait_until_done(busy, event, timeout=None, interval=.01):
+    """
+    Waits until busy() returns False, checking again whenever the
+    threading.Event event is set or at the latest every interval
+    seconds. Devices which are notified of state changes set the event,
+    legacy devices are simply polled.
+
+    :param busy: Callable which returns the busy state
+    :param event: threading.Event which wakes up the waiting thread
+    :param timeout: Maximum time to wait, None for no limit
+    :type timeout: float
+    :param interval: Maximum time between busy() calls
+    :type interval: float
+    :returns: True if done, False on timeout
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while busy():
+        wait = interval
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+        event.wait(wait)
+        event.clear()
+    return True
+
+
+def wait_all_done(gadgets, timeout=None):
+    """
+    Calls wait_done() on each of a sequence of motors or detectors,
+    sharing a common timeout.
+
+    :param gadgets: Sequence of objects with a wait_done(timeout) method
+    :param timeout: Maximum time to wait in total, None for no limit
+    :type timeout: float
+    :returns: True if all are done, False on timeout
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    for g in gadgets:
+        remaining = None if deadline is None else max(deadline - time.time(), 0)
+        if not g.wait_done(remaining):
+            return False
+    return True
+
+
 class SpecTable(object):
     """
     A dyamic table, for use when the column titles and one data row are